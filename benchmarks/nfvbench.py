@@ -0,0 +1,350 @@
+""" nfvbench.py benchmarks the hot paths of nfv_tree
+
+:class NfvBench : runs every benchmark against a local directory and an image file
+:func  compare  : benchmarks of a result which regressed against a baseline
+
+Usage (from the root of the repo):
+
+    python -m benchmarks.nfvbench --dir /dev/shm --output result.json
+    python -m benchmarks.nfvbench --dir /dev/shm --baseline result.json --threshold 10
+    python -m benchmarks.nfvbench --files 10000 100000 1000000 --only tree.
+
+NOTEs:
+- each benchmark is repeated, the best time of the repeats is compared,
+  since noise of a shared host only ever makes a run slower
+- results are JSON, keyed by benchmark name, e.g. 'seek_to.zipfian' or
+  'tree.create[10000]', along with the host they were taken on
+- with a baseline, every benchmark slower than its baseline by more than
+  the threshold is flagged and the exit status is 1
+- the image file stands in for a loopback device, NfvBlock works on both,
+  pass --image to benchmark a real device (its data is overwritten!)
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+
+from statistics import median
+
+from nfv_tree.nfvtree import NfvTree, NfvFile, NfvIoTactic, NfvLockManager
+from nfv_tree.nfvblock import NfvBlock
+from nfv_tree.nfvexec import NfvExecutor
+
+
+class NfvBench:
+    """ a run of nfv_tree benchmarks
+    """
+    __slots__ = (
+            '_dir',
+            '_image',
+            '_files',
+            '_repeat',
+            '_workers',
+            '_only',
+            '_results',
+    )
+
+    def __init__(self, dir=None, image=None, files=(10000,), repeat=3, workers=0, only=None):
+        """ NfvBench constructor
+
+        :param dir     : directory benchmarks run in, tmpfs or ext4 of local disk
+        :param image   : path of block device or image file of NfvBlock benchmarks,
+                         default to an image file in dir
+        :param files   : numbers of files of NfvTree benchmarks
+        :param repeat  : number of times each benchmark is repeated
+        :param workers : number of threads of NfvTree bulk manipulations, serial if it's 0
+        :param only    : prefixes of benchmark names to be run, default to all
+        :return        : NfvBench object
+        """
+        if dir is None:
+            raise ValueError("ERROR: parameter dir is required!")
+        if repeat < 1:
+            raise ValueError("ERROR: parameter repeat should be larger than 0!")
+        self._dir = dir
+        self._image = image
+        self._files = tuple(files)
+        self._repeat = repeat
+        self._workers = workers
+        self._only = None if not only else tuple(only)
+        self._results = {}
+
+    def _wanted(self, name):
+        return self._only is None or name.startswith(self._only)
+
+    def record(self, name=None, samples=(), ops=1, nbytes=0):
+        """ record the times a benchmark took
+
+        :param name    : name of the benchmark
+        :param samples : seconds each repeat took
+        :param ops     : number of operations of each repeat
+        :param nbytes  : number of bytes moved by each repeat
+        :return        : *none*
+        """
+        best = min(samples)
+        self._results[name] = {
+            'ops'         : ops,
+            'bytes'       : nbytes,
+            'best'        : best,
+            'median'      : median(samples),
+            'ops_per_sec' : ops / best if best else 0.0,
+            'mb_per_sec'  : nbytes / best / 1048576 if best else 0.0,
+        }
+        print("%-32s %12.6fs %14.1f ops/s %10.1f MB/s" % (name, best, self._results[name]['ops_per_sec'], \
+                self._results[name]['mb_per_sec']), file=sys.stderr)
+
+    def measure(self, name=None, func=None, ops=1, nbytes=0, setup=None):
+        """ time a callable object, it's repeated and so is setup before it
+
+        :param name   : name of the benchmark
+        :param func   : callable object accepts what setup returned
+        :param ops    : number of operations of each call
+        :param nbytes : number of bytes moved by each call
+        :param setup  : callable object invoked untimed before each call
+        :return       : *none*
+        """
+        if not self._wanted(name):
+            return
+        samples = []
+        for _ in range(self._repeat):
+            state = setup() if setup is not None else None
+            begin = time.perf_counter()
+            func(state)
+            samples.append(time.perf_counter() - begin)
+        self.record(name, samples, ops, nbytes)
+
+    def run(self):
+        """ run every benchmark
+
+        :return : dict of the results, see report
+        """
+        self.bench_patterns()
+        self.bench_seeks()
+        self.bench_file()
+        self.bench_lock()
+        self.bench_block()
+        for number in self._files:
+            self.bench_tree(number)
+
+        return self.report()
+
+    def bench_patterns(self, count=100, io_size=1048576):
+        """ data pattern generation of NfvIoTactic
+        """
+        granary = NfvIoTactic._datagranary
+
+        def random_pattern(_):
+            for _ in range(count):
+                NfvIoTactic.random_pattern(io_size)
+
+        def compress_pattern(_):
+            for _ in range(count):
+                NfvIoTactic.compress_pattern(compress_ratio=50, io_size=io_size, chunk=8)
+
+        def get_rand_buffer(_):
+            for _ in range(count):
+                NfvIoTactic.get_rand_buffer(io_size, granary)
+
+        self.measure('pattern.random_pattern', random_pattern, count, count * io_size)
+        self.measure('pattern.compress_pattern', compress_pattern, count, count * io_size)
+        self.measure('pattern.get_rand_buffer', get_rand_buffer, count, count * io_size)
+
+    def bench_seeks(self, file_size=268435456, io_size=4096):
+        """ offsets generated by seek_to of every seek type
+        """
+        for seek in NfvIoTactic._seeks:
+            tactic = NfvIoTactic(io_size=io_size, seek_type=seek, seek_seed=1)
+            self.measure('seek_to.%s' % seek, lambda _: sum(1 for _ in tactic.seek_to(file_size=file_size)), \
+                    file_size // io_size)
+
+    def bench_file(self, file_size=16777216, io_size='8k'):
+        """ NfvFile new, read and checksum
+        """
+        tactic = NfvIoTactic(io_size=io_size, data_check=False)
+        path = os.path.join(self._dir, 'bench_file')
+        f = NfvFile(path=path, size=file_size, io_tactic=tactic)
+        numio = -(-file_size // tactic.get_property('io_size'))
+        self.measure('file.new', lambda _: f.new(), numio, file_size)
+        self.measure('file.read', lambda _: f.read(), numio, file_size)
+        self.measure('file.checksum', lambda _: f.checksum(), 1, file_size)
+        self.measure('file.checksum.crc32', lambda _: f.checksum(algorithm='crc32'), 1, file_size)
+        f.remove()
+
+    def bench_lock(self, number=500, file_size=65536):
+        """ locks produced by NfvLockManager.feed_lock
+        """
+        path = os.path.join(self._dir, 'bench_lock')
+        f = NfvFile(path=path, size=file_size, io_tactic=NfvIoTactic(data_check=False))
+        managers = []
+
+        def setup():
+            manager = NfvLockManager()
+            manager.attach(f)
+            managers.append(manager)
+            return manager
+
+        def feed(manager):
+            feeder = manager.feed_lock(length=1, step=1, mode='exclusive')
+            for _ in range(number):
+                next(feeder)
+
+        self.measure('lock.feed_lock', feed, number, setup=setup)
+        # every lock holds a file handle until it's dropped
+        for manager in managers:
+            manager.wipe_lock()
+        f.remove()
+
+    def bench_block(self, image_size=67108864, io_size='64k'):
+        """ NfvBlock.io write and read
+        """
+        image = self._image
+        if image is None:
+            image = os.path.join(self._dir, 'bench_image')
+            with open(image, 'wb') as fh:
+                fh.truncate(image_size)
+        tactic = NfvIoTactic(io_size=io_size, data_check=False)
+        block = NfvBlock(path=image, io_tactic=tactic)
+        size = block._size
+        numio = -(-size // tactic.get_property('io_size'))
+        for operation in ('write', 'read'):
+            for depth in (1, 8):
+                self.measure('block.%s[qd=%d]' % (operation, depth), \
+                        lambda _: sum(block.io(operation=operation, queue_depth=depth)), numio, size)
+        if self._image is None:
+            os.remove(image)
+
+    def bench_tree(self, number=10000, file_size='4k', width=10, depth=2):
+        """ NfvTree create, load, copy and wipe of given number of files
+        """
+        names = ('create', 'load', 'copy', 'wipe')
+        if not any(self._wanted('tree.%s[%d]' % (n, number)) for n in names):
+            return
+        samples = {n: [] for n in names}
+        root = os.path.join(self._dir, 'bench_tree')
+        dest = os.path.join(self._dir, 'bench_tree_copy')
+        tactic = NfvIoTactic(data_check=False)
+        for _ in range(self._repeat):
+            for d in (root, dest):
+                if os.path.exists(d):
+                    shutil.rmtree(d)
+            begin = time.perf_counter()
+            tree = NfvTree(root, width, depth, io_tactic=tactic, executor=self._executor())
+            tree.create_file(size=file_size, number=number)
+            samples['create'].append(time.perf_counter() - begin)
+
+            begin = time.perf_counter()
+            tree = NfvTree(root, io_tactic=tactic, executor=self._executor())
+            samples['load'].append(time.perf_counter() - begin)
+
+            begin = time.perf_counter()
+            copied = tree.copy(dest)
+            samples['copy'].append(time.perf_counter() - begin)
+
+            begin = time.perf_counter()
+            tree.wipe()
+            samples['wipe'].append(time.perf_counter() - begin)
+            copied.wipe()
+        nbytes = number * NfvIoTactic(io_size=file_size).get_property('io_size')
+        for n in names:
+            name = 'tree.%s[%d]' % (n, number)
+            if self._wanted(name):
+                self.record(name, samples[n], number, 0 if n in ('load', 'wipe') else nbytes)
+
+    def _executor(self):
+        if self._workers:
+            return NfvExecutor(mode='thread', workers=self._workers)
+        return NfvExecutor()
+
+    def report(self):
+        """ results of the benchmarks run so far
+
+        :return : dict of 'host' and 'results', the latter maps benchmark
+                  names to dicts of ops, bytes, best, median, ops_per_sec
+                  and mb_per_sec
+        """
+        return {
+            'host': {
+                'python'   : platform.python_version(),
+                'platform' : platform.platform(),
+                'machine'  : platform.machine(),
+                'cpus'     : os.cpu_count(),
+                'dir'      : self._dir,
+                'repeat'   : self._repeat,
+                'workers'  : self._workers,
+                'time'     : time.strftime('%Y-%m-%dT%H:%M:%S'),
+            },
+            'results': dict(self._results),
+        }
+
+
+def compare(result=None, baseline=None, threshold=10.0):
+    """ benchmarks of a result which regressed against a baseline
+
+    :param result    : dict returned by NfvBench.report
+    :param baseline  : dict returned by NfvBench.report of an earlier run
+    :param threshold : percent a benchmark may be slower than its baseline
+    :return          : list of (name, baseline seconds, seconds, percent slower)
+    """
+    regressions = []
+    for name, current in sorted(result['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None or not base['best']:
+            continue
+        slower = (current['best'] / base['best'] - 1) * 100
+        if slower > threshold:
+            regressions.append((name, base['best'], current['best'], slower))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmarks of nfv_tree hot paths')
+    parser.add_argument('--dir', default='/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+                        help='directory benchmarks run in, a scratch directory is made under it')
+    parser.add_argument('--image', default=None,
+                        help='block device or image file of NfvBlock benchmarks, its data is overwritten')
+    parser.add_argument('--files', type=int, nargs='+', default=[10000],
+                        help='numbers of files of NfvTree benchmarks')
+    parser.add_argument('--repeat', type=int, default=3, help='number of times each benchmark is repeated')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='threads of NfvTree bulk manipulations, serial if it is 0')
+    parser.add_argument('--only', nargs='+', default=None, help='prefixes of benchmark names to be run')
+    parser.add_argument('--output', default=None, help='path of the JSON result, default to stdout')
+    parser.add_argument('--baseline', default=None, help='path of a JSON result to be compared with')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='percent a benchmark may be slower than its baseline')
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix='nfvbench_', dir=args.dir)
+    try:
+        bench = NfvBench(dir=scratch, image=args.image, files=args.files, repeat=args.repeat, \
+                         workers=args.workers, only=args.only)
+        result = bench.run()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if args.output is None:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as fh:
+            json.dump(result, fh, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        regressions = compare(result, baseline, args.threshold)
+        for name, before, after, slower in regressions:
+            print("REGRESSION %-32s %.6fs -> %.6fs (+%.1f%%)" % (name, before, after, slower), file=sys.stderr)
+        if regressions:
+            return 1
+        print("no regression beyond %.1f%%" % args.threshold, file=sys.stderr)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
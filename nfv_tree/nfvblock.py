@@ -2,12 +2,12 @@
 This file defined the block io manipulations
 """
 import os
-import mmap
-from nfv_tree.nfvtree import NfvFile, NfvIoTactic, encipher_data, convert_size
+from time import perf_counter_ns
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from nfv_tree.nfvtree import NfvFile, NfvIoTactic, convert_size
+from nfv_tree.nfvverify import NfvVerifyIndex, stamp_id
+from nfv_tree.nfvhook import traced, emit, get_hooks
 from os.path import getsize
-from os import statvfs
-
-import pdb
 
 
 
@@ -21,6 +21,7 @@ class NfvBlock(NfvFile):
         '_size',
         '_name',     # optional
         '_iotactic', #
+        '_checkindex', # digests of the last write run, when data check is on
     )
 
     def __init__(self, path=None, name='RestineLun', io_tactic=NfvIoTactic()):
@@ -34,9 +35,15 @@ class NfvBlock(NfvFile):
             raise RuntimeError("ERROR: Parameter 'path' is required!")
 
         self._path = path
-        self._size = statvfs(self._path).f_bsize * statvfs(self._path).f_blocks
+        # seeking to the end works for both block devices and image files
+        fd = os.open(self._path, os.O_RDONLY)
+        try:
+            self._size = os.lseek(fd, 0, os.SEEK_END)
+        finally:
+            os.close(fd)
         self._name = name
         self._iotactic = io_tactic
+        self._checkindex = None
 
     def set_iotactic(self, io_tactic=None):
         """
@@ -49,14 +56,20 @@ class NfvBlock(NfvFile):
 
         self._iotactic = io_tactic
 
-    def io(self, operation='write', direct=False, start_offset=0, stop_offset=0):
+    def io(self, operation='write', direct=False, start_offset=0, stop_offset=0, queue_depth=1):
         """
         Generator Function
-        Issue IO on the block device, this func serves as the major role of block I/O
+        Issue IO on the block device, this func serves as the major role of block I/O,
+        the whole run is an event of 'block.read' or 'block.write' to the hooks of nfvhook
+        and each I/O is an event of 'read' or 'write' as well
         :param operation    : operation type, either 'read' or 'write'
         :param direct       : Indicate if use direct I/O
         :param start_offset : offset of the I/O to be started
         :param stop_offset  : offset of the I/O to be stopped
+        :param queue_depth  : number of I/Os kept in flight by a pool of pread/pwrite
+                              workers sharing the fd, sizes are yielded as I/Os complete,
+                              writes to the same offset are issued one after another,
+                              a write run is flushed by fsync at the end with fsync of io tactic
         :return: generator object
         """
         start = convert_size(start_offset)
@@ -68,58 +81,166 @@ class NfvBlock(NfvFile):
             stop = self._size
         elif start > self._size:
             raise RuntimeError("ERROR: Start offset should no larger than volume size!")
-        io_range = stop - start
         if operation == 'write':
             openmode = os.O_RDWR
         elif operation == 'read':
             pass
         else:
             raise ValueError("ERROR: Invalid operation!")
+        if queue_depth < 1:
+            raise ValueError("ERROR: Parameter queue_depth should be larger than 0!")
         if direct:
             openmode |= os.O_DIRECT
-            # anyone wants direct is required to use 512 bytes aligned boundary
-            data = mmap.mmap(-1, self._iotactic._iosize)
-            data.write(self._iotactic._data)
+        if operation == 'write' and self._iotactic._datacheck and self._iotactic._datapattern != 'stamp':
+            self._checkindex = NfvVerifyIndex(stop - start, self._iotactic.get_property('io_size'), start)
+        begin = perf_counter_ns() if get_hooks() else None
+        error = None
+        fd = traced('open', self._path, 0, 0, os.open, self._path, openmode)
+        try:
+            requests = self._iotactic.seek_requests(start_offset=start, stop_offset=stop)
+            if queue_depth == 1:
+                for offset, length in requests:
+                    yield self._submit(fd, operation, direct, offset, length)
+            else:
+                with ThreadPoolExecutor(max_workers=queue_depth) as pool:
+                    pending = {}    # future -> offset
+                    inflight = {}   # offset -> future of the last write issued to it
+                    for offset, length in requests:
+                        if len(pending) >= queue_depth:
+                            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                            for fut in done:
+                                done_offset = pending.pop(fut)
+                                if inflight.get(done_offset) is fut:
+                                    del inflight[done_offset]
+                                yield fut.result()
+                        prior = inflight.get(offset)
+                        if prior is not None:
+                            # skewed seek types repeat offsets, writes to the same offset are never
+                            # in flight together, so the digest recorded last is of the data landed last
+                            wait((prior,))
+                        fut = pool.submit(self._submit, fd, operation, direct, offset, length)
+                        pending[fut] = offset
+                        if operation == 'write':
+                            inflight[offset] = fut
+                    for fut in as_completed(pending):
+                        yield fut.result()
+            if operation == 'write' and self._iotactic.get_property('fsync'):
+                traced('fsync', self._path, start, stop - start, os.fsync, fd)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            os.close(fd)
+            if begin is not None:
+                emit('block.' + operation, self._path, start, stop - start, begin, perf_counter_ns(), None, error)
+
+    def _submit(self, fd, operation, direct, offset, length):
+        """
+        Issue a single positional I/O, safe to be called by concurrent workers,
+        direct I/O goes through the aligned buffer pool of the io tactic,
+        and every I/O is paced to the target rates of the io tactic, if any
+        :param fd        : fd of the block device
+        :param operation : operation type, either 'read' or 'write'
+        :param direct    : Indicate if use direct I/O
+        :param offset    : offset of the I/O
+        :param length    : length of the I/O
+        :return: size of the I/O completed
+        """
+        self._iotactic.pace(length)
+        if operation == 'write':
+            if self._iotactic._datapattern == 'stamp':
+                # stamped blocks are verifiable without any record
+                data = self._iotactic.stamp_data(stamp_id(self._name), offset, length)
+                if not direct:
+                    return traced('write', self._path, offset, length, os.pwrite, fd, data, offset)
+                pool = self._iotactic.get_buffer_pool()
+                buf = pool.acquire()
+                try:
+                    buf[:length] = data
+                    return traced('write', self._path, offset, length, os.pwritev, fd, [memoryview(buf)[:length]], offset)
+                finally:
+                    pool.release(buf)
+            if direct:
+                data, digest = self._iotactic.get_buffer_pool().get_data()
+            else:
+                data, digest = self._iotactic.get_data_pattern(), None
+            data = memoryview(data)
+            if self._iotactic._datacheck:
+                if length < len(data):
+                    data, digest = data[:length], None
+                self._checkindex.record(offset, data, digest)
+            return traced('write', self._path, offset, length, os.pwrite, fd, data[:length], offset)
+        if direct:
+            pool = self._iotactic.get_buffer_pool()
+            buf = pool.acquire()
+            try:
+                return traced('read', self._path, offset, length, os.preadv, fd, [memoryview(buf)[:length]], offset)
+            finally:
+                pool.release(buf)
+        return len(traced('read', self._path, offset, length, os.pread, fd, length, offset))
+
+    def verify(self, direct=False, start_offset=0, stop_offset=0, file_id=None, generation=None):
+        """
+        Read back blocks and check them, with 'stamp' data pattern every block of the
+        given range is compared with the one regenerated from its header, which needs
+        no state of the write, otherwise every block written by the last write run with
+        data check on is compared with the digest recorded for its own offset
+        :param direct       : Indicate if use direct I/O
+        :param start_offset : offset of the range to be verified ('stamp' data pattern only)
+        :param stop_offset  : offset the range stops at, default to the end of device
+        :param file_id      : expected file id, default to the one of the first block, so a
+                              device is verified whatever name it was written under
+        :param generation   : expected generation, default to the one of the first block
+        :return: number of blocks verified
+        """
+        stamp = None
+        if self._iotactic._datapattern == 'stamp':
+            stamp = self._iotactic.get_stamp()
+            iosize = self._iotactic.get_property('io_size')
+            start = convert_size(start_offset)
+            stop = convert_size(stop_offset) or self._size
+            requests = ((offset, min(iosize, stop - offset)) for offset in range(start, min(stop, self._size), iosize))
+        elif self._checkindex is None:
+            raise RuntimeError("ERROR: No write run was recorded, data check is required!")
         else:
-            data = self._iotactic._data()
-        remainder = io_range % self._iotactic.get_property('io_size')
-        indexsupplier = self._iotactic.seek_to(start_offset=start, stop_offset=stop)
-        if remainder > 0:
-            rindex = next(indexsupplier)
+            requests = self._checkindex.requests()
+        openmode = os.O_RDONLY
+        if direct:
+            openmode |= os.O_DIRECT
+        pool = self._iotactic.get_buffer_pool()
+        buf = pool.acquire()
+        view = memoryview(buf)
+        failed = 0
+        first = None
+        count = 0
+        fd = os.open(self._path, openmode)
         try:
-            fd = os.open(self._path, openmode)
-            if remainder > 0 and self._iotactic._seek == 'reverse':
-                if self._iotactic._datacheck:
-                    self._io_check_db[encipher_data(data, self._io_check_db)] = True
-                os.lseek(fd, rindex, os.SEEK_CUR)
-                if operation == 'write':
-                    os.write(fd, data[:remainder])
-                    yield len(data[:remainder])
+            for offset, length in requests:
+                if direct:
+                    data = view[:os.preadv(fd, [view[:length]], offset)]
                 else:
-                    yield len(os.read(fd, len(data[:remainder])))
-            for idx in indexsupplier:
-                if self._iotactic._datacheck:
-                    self._io_check_db[encipher_data(data, self._io_check_db)] = True
-                os.lseek(fd, idx, os.SEEK_CUR)
-                if operation == 'write':
-                    os.write(fd, data)
-                    yield len(data)
+                    data = os.pread(fd, length, offset)
+                if stamp is None:
+                    reason = None if self._checkindex.verify(offset, data) else 'digest mismatch'
                 else:
-                    yield len(os.read(fd, len(data)))
-            if remainder > 0 and (self._iotactic.seek_type == 'sequential' or self._iotactic.seek_type == 'random'):
-                if self._iotactic._datacheck:
-                    self._io_check_db[encipher_data(data, self._io_check_db)] = True
-                os.lseek(fd, rindex, os.SEEK_CUR)
-                if operation == 'write':
-                    os.write(fd, data[:remainder])
-                    yield len(data)
-                else:
-                    yield len(os.read(fd, len(data[:remainder])))
-        except OSError as e:
-            print("Parameters Dump: fd:%d, idx:%d" % (fd, idx))
-            raise OSError(str(e))
+                    if file_id is None or generation is None:
+                        header = stamp.parse(data)
+                        if header is not None:
+                            file_id = header[1] if file_id is None else file_id
+                            generation = header[3] if generation is None else generation
+                    reason = stamp.check(data, offset, file_id, generation)
+                if reason is not None:
+                    # failures are counted, a badly corrupted device never piles them up
+                    failed += 1
+                    if first is None:
+                        first = (offset, reason)
+                count += 1
         finally:
-            if fd:
-                os.close(fd)
-
+            view.release()
+            os.close(fd)
+            pool.release(buf)
+        if failed:
+            raise Exception("ERROR: data check failed on %s at %d block(s), first offset: %d (%s)" \
+                    % (self._path, failed, first[0], first[1]))
 
+        return count
@@ -0,0 +1,144 @@
+""" nfvcache.py implemented the persistent cache of file checksums
+
+:class NfvChecksumCache : a SQLite file maps (st_dev, st_ino, size, mtime_ns, ctime_ns) to checksums
+
+NOTEs:
+- an entry is valid only while the file has the very same inode, size, mtime and ctime,
+  any write, truncate or chmod on the file bumps ctime so its entry is never hit again
+- one entry is kept per inode and algorithm, a stale entry is replaced by the next put
+- least recently used entries are evicted once the cache grows beyond its capacity
+- a connection is opened per thread (and per process), pickling keeps the path only
+"""
+
+import time
+import sqlite3
+import threading
+
+
+class NfvChecksumCache:
+    """ SQLite backed cache of file checksums
+    """
+    __slots__ = (
+            '_path',
+            '_capacity',
+            '_local',
+    )
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS checksums (dev INTEGER, ino INTEGER, algorithm TEXT, size INTEGER, "
+        "mtime INTEGER, ctime INTEGER, checksum TEXT, used REAL, PRIMARY KEY (dev, ino, algorithm))",
+        "CREATE INDEX IF NOT EXISTS checksums_used ON checksums (used)",
+    )
+    _EVICT_INTERVAL = 1024  # number of puts between two capacity checks of a connection
+
+    def __init__(self, path=None, capacity=1000000):
+        """ NfvChecksumCache constructor
+
+        :param path     : path of the cache file
+        :param capacity : maximum number of entries kept
+        :return         : NfvChecksumCache object
+        """
+        if path is None:
+            raise ValueError("ERROR: parameter path is required!")
+        if capacity < 1:
+            raise ValueError("ERROR: parameter capacity should be larger than 0!")
+        self._path = path
+        self._capacity = capacity
+        self._local = threading.local()
+
+    def _connect(self):
+        """ get the connection of calling thread, open it on first use
+
+        :return : sqlite3.Connection object
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                for stmt in self._SCHEMA:
+                    conn.execute(stmt)
+            self._local.conn = conn
+            self._local.puts = 0
+        return conn
+
+    def get(self, stat=None, algorithm='md5'):
+        """ look up the checksum of a file
+
+        :param stat      : os.stat_result of the file
+        :param algorithm : hash algorithm of the checksum
+        :return          : checksum value, None if it's not cached or stale
+        """
+        conn = self._connect()
+        row = conn.execute("SELECT size, mtime, ctime, checksum FROM checksums WHERE dev = ? AND ino = ? "
+                "AND algorithm = ?", (stat.st_dev, stat.st_ino, algorithm)).fetchone()
+        if row is None or row[:3] != (stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns):
+            return None
+        with conn:
+            conn.execute("UPDATE checksums SET used = ? WHERE dev = ? AND ino = ? AND algorithm = ?", \
+                    (time.time(), stat.st_dev, stat.st_ino, algorithm))
+        return row[3]
+
+    def put(self, stat=None, algorithm='md5', checksum=None):
+        """ cache the checksum of a file
+
+        :param stat      : os.stat_result of the file taken before it was read
+        :param algorithm : hash algorithm of the checksum
+        :param checksum  : checksum value
+        :return          : *none*
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (stat.st_dev, \
+                    stat.st_ino, algorithm, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns, checksum, time.time()))
+        self._local.puts += 1
+        if self._local.puts % self._EVICT_INTERVAL == 0:
+            self.evict()
+
+    def evict(self, capacity=None):
+        """ evict least recently used entries beyond capacity
+
+        :param capacity : number of entries to be kept, default to capacity of the cache
+        :return         : number of entries evicted
+        """
+        if capacity is None:
+            capacity = self._capacity
+        conn = self._connect()
+        with conn:
+            excess = conn.execute("SELECT count(*) FROM checksums").fetchone()[0] - capacity
+            if excess <= 0:
+                return 0
+            conn.execute("DELETE FROM checksums WHERE rowid IN (SELECT rowid FROM checksums "
+                    "ORDER BY used LIMIT ?)", (excess,))
+        return excess
+
+    def clear(self):
+        """ drop all entries
+
+        :return : *none*
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM checksums")
+
+    def close(self):
+        """ close the connection of calling thread
+
+        :return : *none*
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def __len__(self):
+        return self._connect().execute("SELECT count(*) FROM checksums").fetchone()[0]
+
+    def __getstate__(self):
+        """ connections can not be pickled, pickle the configuration only
+        """
+        return (self._path, self._capacity)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
@@ -0,0 +1,338 @@
+""" nfvexec.py implemented the pluggable executor used by bulk manipulations
+
+:class NfvExecutor   : runs one task per item, serially or on a thread/process pool
+:class NfvExecReport : outcome of a bulk run, per-item errors and aggregate throughput
+:class NfvExecError  : raised when one or more items of a bulk run failed
+
+NOTEs:
+- 'serial' mode keeps the original one-request-at-a-time behavior
+- 'thread' mode suits network filesystems, where every task mostly waits on the server
+- 'process' mode requires picklable tasks and items, results are copies of the items
+- at most (workers * backlog) tasks are in flight, so huge item lists stay cheap
+- hooks which are able to spawn a copy of themselves (see nfvhook) see the
+  events of 'process' workers as well, the copies are shipped back with
+  each result and merged into the hooks
+"""
+
+import os
+import time
+
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from nfv_tree.nfvhook import get_hooks, set_hooks
+
+
+class NfvExecError(Exception):
+    """ raised when a bulk run finished with failed items
+
+    the whole NfvExecReport is attached, so caller could inspect
+    every single failure rather than only the first one
+    """
+
+    def __init__(self, report=None):
+        self.report = report
+        failures = report.get_property('failures')
+        message = "ERROR: %d of %d operations failed, first failure: %r" % (
+            len(failures), report.get_property('total'), failures[0][1])
+        super().__init__(message)
+
+
+class NfvExecReport:
+    """ outcome of a bulk run
+
+    records result of each succeeded item, error of each failed
+    item, the bytes processed and the wall-clock time elapsed
+    """
+    __slots__ = (
+            '_results',
+            '_succeeded',
+            '_failures',
+            '_bytes',
+            '_elapsed',
+    )
+
+    def __init__(self):
+        """ initialize an empty report
+
+        :return : NfvExecReport object
+        """
+        self._results = []
+        self._succeeded = 0
+        self._failures = []
+        self._bytes = 0
+        self._elapsed = 0.0
+
+    def add_result(self, item, result, nbytes=0, keep=True):
+        """ record an item which has been processed successfully
+
+        :param item   : the item been processed
+        :param result : value returned by the task
+        :param nbytes : number of bytes moved by the task
+        :param keep   : keep the result in report, or count it only
+        :return       : *none*
+        """
+        if keep:
+            self._results.append(result)
+        self._succeeded += 1
+        self._bytes += nbytes
+
+    def add_failure(self, item, error):
+        """ record an item which failed to be processed
+
+        :param item  : the item been processed
+        :param error : exception raised by the task
+        :return      : *none*
+        """
+        self._failures.append((item, error))
+
+    def merge(self, other=None, elapsed=None):
+        """ add the items of another report, e.g. the one of a worker
+
+        :param other   : NfvExecReport object, None to set elapsed only
+        :param elapsed : wall-clock time of the merged run, default to
+                         the longer one of both reports
+        :return        : self
+        """
+        if other is not None:
+            self._results.extend(other._results)
+            self._succeeded += other._succeeded
+            self._failures.extend(other._failures)
+            self._bytes += other._bytes
+            self._elapsed = max(self._elapsed, other._elapsed)
+        if elapsed is not None:
+            self._elapsed = elapsed
+        return self
+
+    def get_property(self, name=None):
+        """ get the value of given property
+
+        :param name : name of property to be retrieved
+        :return     : value of given parameter name, if param name was not given, return all properies
+        """
+        properties = {
+            'results'    : self._results,
+            'failures'   : self._failures,
+            'succeeded'  : self._succeeded,
+            'failed'     : len(self._failures),
+            'total'      : self._succeeded + len(self._failures),
+            'bytes'      : self._bytes,
+            'elapsed'    : self._elapsed,
+            'throughput' : self.throughput,
+            'ops'        : self.ops,
+        }
+
+        if name is None:
+            return properties
+        if name in properties.keys():
+            return properties[name]
+        else:
+            raise Exception("Given property name not found")
+
+    @property
+    def throughput(self):
+        """
+        Aggregate throughput of the run
+        :return: bytes per second
+        """
+        if self._elapsed <= 0:
+            return 0.0
+        return self._bytes / self._elapsed
+
+    @property
+    def ops(self):
+        """
+        Aggregate operation rate of the run
+        :return: items per second
+        """
+        if self._elapsed <= 0:
+            return 0.0
+        return (self._succeeded + len(self._failures)) / self._elapsed
+
+    def check(self):
+        """ raise NfvExecError if any item failed
+
+        :return : self object if all items succeeded
+        """
+        if self._failures:
+            raise NfvExecError(self)
+        return self
+
+
+class NfvExecutor:
+    """ pluggable executor for bulk manipulations
+
+    NfvTree hands each of its bulk manipulations to a NfvExecutor
+    object, which decides how many requests are outstanding at
+    the same time against the file system
+    """
+    __slots__ = (
+            '_mode',
+            '_workers',
+            '_backlog',
+            '_pool',
+    )
+
+    _modes = ('serial', 'thread', 'process')
+
+    def __init__(self, mode='serial', workers=None, backlog=4):
+        """ NfvExecutor constructor
+
+        :param mode    : execution mode, either 'serial', 'thread' or 'process'
+        :param workers : number of workers of the pool, default to number of cpus
+                         for 'process' and 4 times of it for 'thread'
+        :param backlog : number of queued tasks per worker
+        :return        : NfvExecutor object
+        """
+        if mode not in self._modes:
+            raise ValueError("ERROR: Given mode %s is invalid!" % mode)
+        cpus = os.cpu_count() or 1
+        if workers is None:
+            workers = cpus * 4 if mode == 'thread' else cpus
+        if workers < 1:
+            raise ValueError("ERROR: parameter workers should be larger than 0!")
+        if mode == 'serial':
+            workers = 1
+        self._mode = mode
+        self._workers = workers
+        self._backlog = max(1, backlog)
+        self._pool = None
+
+    def get_property(self, name=None):
+        """ get the value of given property
+
+        :param name : name of property to be retrieved
+        :return     : value of given parameter name, if param name was not given, return all properies
+        """
+        properties = {
+            'mode'    : self._mode,
+            'workers' : self._workers,
+            'backlog' : self._backlog,
+        }
+
+        if name is None:
+            return properties
+        if name in properties.keys():
+            return properties[name]
+        else:
+            raise Exception("Given property name not found")
+
+    def run(self, task=None, items=(), weigh=None, consume=None):
+        """ run task against every item
+
+        the order of results is not guaranteed except 'serial' mode,
+        an exception raised by task is recorded against its item and
+        never interrupts the rest of the run
+
+        :param task    : callable object which accepts one item
+        :param items   : iterable object supplies the items
+        :param weigh   : callable object which maps a result to bytes it moved
+        :param consume : callable object which takes each result in the calling
+                         thread, results are not kept in report if it's given
+        :return        : NfvExecReport object
+        """
+        if task is None:
+            raise ValueError("ERROR: parameter task is required!")
+        report = NfvExecReport()
+        begin = time.perf_counter()
+        if self._mode == 'serial':
+            for item in items:
+                try:
+                    result = task(item)
+                except Exception as e:
+                    report.add_failure(item, e)
+                else:
+                    report.add_result(item, result, weigh(result) if weigh else 0, consume is None)
+                    if consume is not None:
+                        consume(result)
+        else:
+            hooks = ()
+            if self._mode == 'process':
+                hooks = tuple(h for h in get_hooks() if hasattr(h, 'spawn'))
+            if hooks:
+                task = partial(_hooked_task, task, tuple(h.spawn() for h in hooks))
+            pool = self._get_pool()
+            limit = self._workers * self._backlog
+            pending = {}
+            itemsupplier = iter(items)
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < limit:
+                    try:
+                        item = next(itemsupplier)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending[pool.submit(task, item)] = item
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    item = pending.pop(fut)
+                    try:
+                        result = fut.result()
+                    except Exception as e:
+                        report.add_failure(item, e)
+                    else:
+                        if hooks:
+                            result, spawns = result
+                            for hook, spawn in zip(hooks, spawns):
+                                hook.merge(spawn)
+                        report.add_result(item, result, weigh(result) if weigh else 0, consume is None)
+                        if consume is not None:
+                            consume(result)
+        report._elapsed = time.perf_counter() - begin
+
+        return report
+
+    def _get_pool(self):
+        """ get the underlying pool, create it on first use
+
+        :return : concurrent.futures executor object
+        """
+        if self._pool is None:
+            if self._mode == 'thread':
+                self._pool = ThreadPoolExecutor(max_workers=self._workers)
+            else:
+                self._pool = ProcessPoolExecutor(max_workers=self._workers)
+        return self._pool
+
+    def shutdown(self):
+        """ release the underlying pool, it will be re-created on next run
+
+        :return : *none*
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def __getstate__(self):
+        """ pools can not be pickled, pickle the configuration only
+        """
+        return (self._mode, self._workers, self._backlog)
+
+    def __setstate__(self, state):
+        self._mode, self._workers, self._backlog = state
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+def _hooked_task(task, hooks, item):
+    """ run a task in a worker process with spawned copies of the hooks
+
+    :param task  : callable object which accepts one item
+    :param hooks : tuple of hooks spawned by the calling process
+    :param item  : the item
+    :return      : tuple of (value returned by task, the hooks)
+    """
+    # hooks inherited from the parent are replaced, they would never be merged back
+    inherited = set_hooks(hooks)
+    try:
+        return (task(item), hooks)
+    finally:
+        set_hooks(inherited)
@@ -0,0 +1,176 @@
+""" nfvhook.py implemented the event hooks around file system calls and file operations
+
+:class NfvEvent : a single operation done, passed to every hook
+:func  add_hook : register a callable object invoked with each NfvEvent
+:func  traced   : invoke a call, hooks see it as an event
+:func  hooked   : decorate a method, hooks see each call of it as an event
+
+NOTEs:
+- system calls are events of their own name, i.e. 'open', 'read', 'write',
+  'fsync', 'rename', 'unlink', 'lock' and 'unlock', whole operations are
+  prefixed by their class, e.g. 'file.new', 'file.copy' and 'block.write'
+- hooks are invoked synchronously by the thread which did the operation,
+  right after it's done, so they should be quick and never raise
+- timestamps are time.perf_counter_ns values, which are monotonic and
+  comparable across processes of the same host
+- while no hook is registered, a probe costs a single global lookup
+- a hook supporting 'process' executors provides spawn() for an empty copy
+  of itself and merge() to take the copy back, workers invoke the copies
+  and ship them back with each result, see NfvExecutor, so the copies should
+  keep what they need of events rather than the events, whose results may
+  not be picklable, e.g. file objects returned by open
+"""
+
+import functools
+
+from time import perf_counter_ns
+
+
+class NfvEvent:
+    """ an operation done
+    """
+    __slots__ = (
+            'op',
+            'path',
+            'offset',
+            'size',
+            'start',
+            'end',
+            'result',
+            'error',
+    )
+
+    def __init__(self, op=None, path=None, offset=0, size=0, start=0, end=0, result=None, error=None):
+        """ NfvEvent constructor
+
+        :param op     : name of the operation
+        :param path   : path of the file (or device) operated
+        :param offset : offset the operation started at
+        :param size   : number of bytes the operation was asked for
+        :param start  : perf_counter_ns value the operation started at
+        :param end    : perf_counter_ns value the operation finished at
+        :param result : value returned by the operation
+        :param error  : exception raised by the operation, None if it succeeded
+        :return       : NfvEvent object
+        """
+        self.op = op
+        self.path = path
+        self.offset = offset
+        self.size = size
+        self.start = start
+        self.end = end
+        self.result = result
+        self.error = error
+
+    @property
+    def elapsed(self):
+        """ latency of the operation in nanoseconds
+        """
+        return self.end - self.start
+
+    def __repr__(self):
+        return "NfvEvent(%r, %r, offset=%d, size=%d, elapsed=%dns%s)" % (self.op, self.path, \
+                self.offset or 0, self.size or 0, self.end - self.start, \
+                '' if self.error is None else ', error=%r' % self.error)
+
+
+_hooks = ()
+
+
+def add_hook(hook=None):
+    """ register a hook
+
+    :param hook : callable object accepts a NfvEvent object
+    :return     : the hook
+    """
+    global _hooks
+    if hook is None:
+        raise ValueError("ERROR: parameter hook is required!")
+    if hook not in _hooks:
+        _hooks = _hooks + (hook,)
+    return hook
+
+
+def remove_hook(hook=None):
+    """ unregister a hook
+
+    :param hook : hook registered before
+    :return     : *none*
+    """
+    global _hooks
+    _hooks = tuple(h for h in _hooks if h is not hook)
+
+
+def get_hooks():
+    """ get the hooks registered
+
+    :return : tuple of hooks, empty if there is none
+    """
+    return _hooks
+
+
+def set_hooks(hooks=()):
+    """ replace the hooks registered
+
+    :param hooks : iterable object supplies hooks
+    :return      : tuple of hooks registered before
+    """
+    global _hooks
+    hooks, _hooks = _hooks, tuple(hooks)
+    return hooks
+
+
+def emit(op=None, path=None, offset=0, size=0, start=0, end=0, result=None, error=None):
+    """ pass an event to every hook, for operations which are not a single call
+
+    :return : *none*
+    """
+    event = NfvEvent(op, path, offset, size, start, end, result, error)
+    for hook in _hooks:
+        hook(event)
+
+
+def traced(op=None, path=None, offset=0, size=0, func=None, *args, **kwargs):
+    """ invoke a call, pass it to every hook as an event if there is any
+
+    :param op     : name of the operation
+    :param path   : path of the file operated
+    :param offset : offset the call starts at
+    :param size   : number of bytes the call is asked for
+    :param func   : callable object to be invoked
+    :param args   : arguments passed to func
+    :return       : value returned by func
+    """
+    hooks = _hooks
+    if not hooks:
+        return func(*args, **kwargs)
+    result = error = None
+    start = perf_counter_ns()
+    try:
+        result = func(*args, **kwargs)
+        return result
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        event = NfvEvent(op, path, offset, size, start, perf_counter_ns(), result, error)
+        for hook in hooks:
+            hook(event)
+
+
+def hooked(op=None, span=None):
+    """ decorate a method, so that each call of it is an event
+
+    :param op   : name of the operation
+    :param span : callable object maps the object to (path, offset, size)
+    :return     : decorator
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not _hooks:
+                return method(self, *args, **kwargs)
+            path, offset, size = span(self)
+            return traced(op, path, offset, size, method, self, *args, **kwargs)
+        return wrapper
+    return decorate
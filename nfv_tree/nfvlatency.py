@@ -0,0 +1,342 @@
+""" nfvlatency.py implemented the latency recording of file system calls
+
+:class NfvHistogram : log bucketed histogram of latencies in nanoseconds
+:class NfvLatency   : histograms of each operation, recorded per thread and merged on demand
+
+NOTEs:
+- buckets are laid out like HDR histograms, values below 128 own a bucket each,
+  larger ones are bucketed by their 7 leading bits, so any value recorded is
+  reported within 1/64 (about 1.6%) of itself whatever its magnitude
+- histograms merge by adding bucket counts, the ones of threads, processes or
+  separate runs are merged into exactly the histogram of all their values
+- each thread records into its own histograms, no lock is taken on the hot path
+- NfvLatency is a hook of nfvhook, start_recording registers it, so every
+  event is recorded against its operation, 'process' executors ship the
+  histograms of their workers back with each result
+"""
+
+import threading
+
+from nfv_tree.nfvhook import add_hook, remove_hook
+
+
+class NfvHistogram:
+    """ HDR-style histogram of non-negative integer values
+    """
+    __slots__ = (
+            '_counts',
+            '_total',
+            '_sum',
+            '_min',
+            '_max',
+    )
+
+    _SUB_BITS = 7
+    _HALF = 1 << (_SUB_BITS - 1)
+
+    def __init__(self):
+        """ NfvHistogram constructor
+
+        :return : NfvHistogram object
+        """
+        self._counts = []
+        self._total = 0
+        self._sum = 0
+        self._min = None
+        self._max = 0
+
+    @classmethod
+    def _index(cls, value):
+        """ index of the bucket a value falls in
+
+        :param value : non-negative integer
+        :return      : index of the bucket
+        """
+        shift = value.bit_length() - cls._SUB_BITS
+        if shift <= 0:
+            return value
+        return (shift << (cls._SUB_BITS - 1)) + (value >> shift)
+
+    @classmethod
+    def _bound(cls, index):
+        """ largest value of a bucket
+
+        :param index : index of the bucket
+        :return      : integer
+        """
+        if index < 2 * cls._HALF:
+            return index
+        shift = (index >> (cls._SUB_BITS - 1)) - 1
+        return ((index - shift * cls._HALF + 1) << shift) - 1
+
+    def record(self, value=0, count=1):
+        """ record a value
+
+        :param value : non-negative integer, e.g. latency in nanoseconds
+        :param count : number of times the value is recorded
+        :return      : *none*
+        """
+        index = self._index(value)
+        counts = self._counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += count
+        self._total += count
+        self._sum += value * count
+        if self._min is None or value < self._min:
+            self._min = value
+        if value > self._max:
+            self._max = value
+
+    def merge(self, other=None):
+        """ add the values of another histogram into this one
+
+        :param other : NfvHistogram object
+        :return      : self
+        """
+        if not other._total:
+            return self
+        counts = self._counts
+        if len(other._counts) > len(counts):
+            counts.extend([0] * (len(other._counts) - len(counts)))
+        for index, count in enumerate(other._counts):
+            if count:
+                counts[index] += count
+        self._total += other._total
+        self._sum += other._sum
+        if self._min is None or other._min < self._min:
+            self._min = other._min
+        self._max = max(self._max, other._max)
+        return self
+
+    def percentile(self, percent=50.0):
+        """ value below or at which given percent of recorded values fall
+
+        :param percent : percentile in 0 ~ 100, e.g. 99.9
+        :return        : integer, 0 if nothing was recorded
+        """
+        if not 0 <= percent <= 100:
+            raise ValueError("ERROR: percentile should be in 0 ~ 100!")
+        if not self._total:
+            return 0
+        rank = max(1, -int(-percent * self._total // 100))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return min(max(self._bound(index), self._min), self._max)
+        return self._max
+
+    def get_property(self, name=None):
+        """ get the value of given property
+
+        :param name : name of property to be retrieved
+        :return     : value of given parameter name, if param name was not given, return all properies
+        """
+        properties = {
+            'count' : self._total,
+            'min'   : self._min or 0,
+            'max'   : self._max,
+            'mean'  : self._sum / self._total if self._total else 0.0,
+            'p50'   : self.percentile(50),
+            'p99'   : self.percentile(99),
+            'p99.9' : self.percentile(99.9),
+        }
+
+        if name is None:
+            return properties
+        if name in properties.keys():
+            return properties[name]
+        else:
+            raise Exception("Given property name not found")
+
+    def __len__(self):
+        return self._total
+
+    def __getstate__(self):
+        """ pickle the buckets recorded only, most of them are empty
+        """
+        return ({i: c for i, c in enumerate(self._counts) if c}, self._total, self._sum, self._min, self._max)
+
+    def __setstate__(self, state):
+        buckets, self._total, self._sum, self._min, self._max = state
+        self._counts = [0] * (max(buckets) + 1 if buckets else 0)
+        for index, count in buckets.items():
+            self._counts[index] = count
+
+
+class NfvLatency:
+    """ latency histograms keyed by operation, e.g. 'open', 'write', 'fsync'
+    """
+    __slots__ = (
+            '_local',
+            '_shards',
+            '_lock',
+    )
+
+    def __init__(self):
+        """ NfvLatency constructor
+
+        :return : NfvLatency object
+        """
+        self._local = threading.local()
+        self._shards = []           # histograms of each thread, {op: NfvHistogram}
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        """ get the histograms of calling thread, create them on first use
+
+        :return : dict maps operations to NfvHistogram objects
+        """
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def record(self, op=None, nanoseconds=0):
+        """ record the latency of an operation
+
+        :param op          : name of the operation
+        :param nanoseconds : latency in nanoseconds
+        :return            : *none*
+        """
+        shard = self._shard()
+        hist = shard.get(op)
+        if hist is None:
+            hist = shard[op] = NfvHistogram()
+        hist.record(nanoseconds)
+
+    def __call__(self, event=None):
+        """ record a NfvEvent object, as a hook
+
+        :param event : NfvEvent object
+        :return      : *none*
+        """
+        self.record(event.op, event.end - event.start)
+
+    def spawn(self):
+        """ an empty recorder to be invoked by a worker process, see nfvhook
+
+        :return : NfvLatency object
+        """
+        return NfvLatency()
+
+    def histograms(self):
+        """ histograms of every operation merged across threads
+
+        :return : dict maps operations to NfvHistogram objects
+        """
+        merged = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for op, hist in list(shard.items()):
+                merged.setdefault(op, NfvHistogram()).merge(hist)
+        return merged
+
+    def histogram(self, op=None):
+        """ histogram of an operation merged across threads
+
+        :param op : name of the operation
+        :return   : NfvHistogram object, empty if the operation was never recorded
+        """
+        merged = NfvHistogram()
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            hist = shard.get(op)
+            if hist is not None:
+                merged.merge(hist)
+        return merged
+
+    def percentiles(self, percents=(50, 99, 99.9)):
+        """ latency percentiles of every operation
+
+        :param percents : percentiles to be reported
+        :return         : dict maps operations to {'p50': ns, 'p99': ns, ...}
+        """
+        return {op: {'p%s' % p: hist.percentile(p) for p in percents} \
+                for op, hist in sorted(self.histograms().items())}
+
+    def merge(self, other=None):
+        """ add the histograms of another recorder, e.g. the one of a worker process
+
+        :param other : NfvLatency object, or dict maps operations to NfvHistogram objects
+        :return      : self
+        """
+        if isinstance(other, NfvLatency):
+            other = other.histograms()
+        shard = self._shard()
+        for op, hist in other.items():
+            shard.setdefault(op, NfvHistogram()).merge(hist)
+        return self
+
+    def drain(self):
+        """ take the histograms recorded so far and start over
+
+        :return : dict maps operations to NfvHistogram objects
+        """
+        with self._lock:
+            shards = list(self._shards)
+        drained = {}
+        for shard in shards:
+            for op in list(shard):
+                hist = shard.pop(op, None)
+                if hist is not None:
+                    drained.setdefault(op, NfvHistogram()).merge(hist)
+        return drained
+
+    def reset(self):
+        """ forget everything recorded
+
+        :return : *none*
+        """
+        self.drain()
+
+    def __getstate__(self):
+        """ thread locals can not be pickled, pickle the merged histograms
+        """
+        return self.histograms()
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.merge(state)
+
+
+_recorder = None
+
+
+def start_recording(recorder=None):
+    """ record the latency of every file system call from now on
+
+    :param recorder : NfvLatency object to be recorded into, default to a new one
+    :return         : the NfvLatency object being recorded into
+    """
+    global _recorder
+    stop_recording()
+    _recorder = NfvLatency() if recorder is None else recorder
+    add_hook(_recorder)
+    return _recorder
+
+
+def stop_recording():
+    """ stop recording latencies
+
+    :return : the NfvLatency object recorded into, None if it wasn't recording
+    """
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is not None:
+        remove_hook(recorder)
+    return recorder
+
+
+def get_recorder():
+    """ get the NfvLatency object being recorded into
+
+    :return : NfvLatency object, None if it isn't recording
+    """
+    return _recorder
+
@@ -0,0 +1,221 @@
+""" nfvmanifest.py implemented the on-disk manifest of a file tree
+
+:class NfvManifest : a SQLite file records directories, files, sizes and checksums of a tree
+
+NOTEs:
+- paths are stored relative to the tree root, each directory once
+- checksums are recorded along with their hash algorithm, checksums of
+  manifests saved without it are loaded as of unknown algorithm
+- staleness is checked by the mtime of every recorded directory, which catches files
+  created, removed or renamed anywhere in the tree, and by stats of sampled files,
+  which is not a full proof, files rewritten in place may go unnoticed
+- a tree manipulated after its manifest was saved invalidates the manifest, which
+  is never fresh again until it's saved
+- the manifest knows nothing about NfvTree, NfvTree.save_manifest/load_manifest drive it
+"""
+
+import os
+import sqlite3
+
+from random import Random
+
+
+class NfvManifest:
+    """ SQLite backed manifest of a file tree
+    """
+    __slots__ = (
+            '_path',
+            '_valid',
+    )
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+        "CREATE TABLE IF NOT EXISTS dirs (id INTEGER PRIMARY KEY, path TEXT, mtime INTEGER)",
+        "CREATE TABLE IF NOT EXISTS files (dir INTEGER, name TEXT, size INTEGER, checksum TEXT, algorithm TEXT)",
+    )
+
+    def __init__(self, path=None):
+        """ NfvManifest constructor
+
+        :param path : path of the manifest file
+        :return     : NfvManifest object
+        """
+        if path is None:
+            raise ValueError("ERROR: parameter path is required!")
+        self._path = path
+        self._valid = None  # unknown until saved or invalidated
+
+    def exists(self):
+        """ check if the manifest file has been saved
+
+        :return : True or False
+        """
+        return os.path.isfile(self._path)
+
+    def save(self, tree_root=None, width=0, depth=0, dirs=(), files=()):
+        """ save a tree into manifest, replacing whatever it recorded
+
+        :param tree_root : root path of the tree
+        :param width     : width of the tree
+        :param depth     : depth of the tree
+        :param dirs      : iterable of directory paths under tree_root
+        :param files     : iterable of (path, size, checksum, algorithm) tuples
+        :return          : number of files saved
+        """
+        if tree_root is None:
+            raise ValueError("ERROR: parameter tree_root is required!")
+        dirids = {}
+
+        def relative(path):
+            rel = os.path.relpath(path, tree_root)
+            return '' if rel == '.' else rel
+
+        def dirid(dir):
+            rel = relative(dir)
+            if rel not in dirids:
+                dirids[rel] = len(dirids)
+            return dirids[rel]
+
+        def mtime(rel):
+            try:
+                return os.stat(os.path.join(tree_root, rel)).st_mtime_ns
+            except OSError:
+                return None
+
+        for d in dirs:
+            dirid(d)
+        dirid(tree_root)
+        count = 0
+
+        def rows():
+            nonlocal count
+            for path, size, checksum, algorithm in files:
+                dir, name = os.path.split(path)
+                count += 1
+                yield (dirid(dir), name, size, checksum, algorithm)
+
+        conn = sqlite3.connect(self._path)
+        try:
+            with conn:
+                # tables of an older layout are replaced as a whole
+                conn.execute("DROP TABLE IF EXISTS dirs")
+                conn.execute("DROP TABLE IF EXISTS files")
+                for stmt in self._SCHEMA:
+                    conn.execute(stmt)
+                conn.execute("DELETE FROM meta")
+                conn.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?)", rows())
+                conn.executemany("INSERT INTO dirs VALUES (?, ?, ?)", \
+                        ((i, d, mtime(d)) for d, i in dirids.items()))
+                meta = {
+                    'root'       : os.path.abspath(tree_root),
+                    'root_mtime' : os.stat(tree_root).st_mtime_ns,
+                    'width'      : width,
+                    'depth'      : depth,
+                    'files'      : count,
+                    'valid'      : 1,
+                }
+                conn.executemany("INSERT INTO meta VALUES (?, ?)", ((k, str(v)) for k, v in meta.items()))
+        finally:
+            conn.close()
+        self._valid = True
+
+        return count
+
+    def get_meta(self):
+        """ get the meta data of the saved tree
+
+        :return : dict of root, root_mtime, width, depth, files and valid
+        """
+        conn = sqlite3.connect(self._path)
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+        finally:
+            conn.close()
+        meta.setdefault('valid', 1)
+        for key in ('root_mtime', 'width', 'depth', 'files', 'valid'):
+            meta[key] = int(meta[key])
+
+        return meta
+
+    def invalidate(self):
+        """ mark the manifest out of date, the tree was changed since saved
+
+        only the first call after a save touches the manifest file
+
+        :return : *none*
+        """
+        if self._valid is False:
+            return
+        if self.exists():
+            conn = sqlite3.connect(self._path)
+            try:
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('valid', '0')")
+            finally:
+                conn.close()
+        self._valid = False
+
+    def is_fresh(self, tree_root=None, samples=32):
+        """ cheaply check if the manifest still describes the on-disk tree
+
+        the manifest must not be invalidated, the root must be the same
+        directory, every recorded directory must have an unchanged mtime,
+        and the sampled files must exist with the recorded sizes
+
+        :param tree_root : root path of the tree
+        :param samples   : number of files to be sampled and stat-ed
+        :return          : True or False
+        """
+        if not self.exists():
+            return False
+        try:
+            meta = self.get_meta()
+            if not meta['valid'] or meta['root'] != os.path.abspath(tree_root):
+                return False
+            if os.stat(tree_root).st_mtime_ns != meta['root_mtime']:
+                return False
+            conn = sqlite3.connect(self._path)
+            try:
+                for dir, mtime in conn.execute("SELECT path, mtime FROM dirs"):
+                    if mtime is None or os.stat(os.path.join(tree_root, dir)).st_mtime_ns != mtime:
+                        return False
+                if meta['files'] == 0 or samples <= 0:
+                    return True
+                rowids = Random().sample(range(1, meta['files'] + 1), min(samples, meta['files']))
+                rows = conn.execute("SELECT dirs.path, files.name, files.size FROM files JOIN dirs "
+                        "ON files.dir = dirs.id WHERE files.rowid IN (%s)" % ','.join('?' * len(rowids)), rowids)
+                for dir, name, size in rows:
+                    if os.stat(os.path.join(tree_root, dir, name)).st_size != size:
+                        return False
+            finally:
+                conn.close()
+        except (OSError, KeyError, sqlite3.Error):
+            return False
+
+        return True
+
+    def load(self, tree_root=None):
+        """ load directories and files from manifest
+
+        :param tree_root : root path the relative paths are joined to
+        :return          : tuple of (meta dict, list of dir paths, generator of
+                           (path, size, checksum, algorithm) tuples)
+        """
+        meta = self.get_meta()
+        conn = sqlite3.connect(self._path)
+        dirtable = dict(conn.execute("SELECT id, path FROM dirs"))
+        dirs = [os.path.join(tree_root, d) if d else tree_root for d in dirtable.values()]
+
+        def files():
+            try:
+                joined = {i: os.path.join(tree_root, d) if d else tree_root for i, d in dirtable.items()}
+                try:
+                    rows = conn.execute("SELECT dir, name, size, checksum, algorithm FROM files")
+                except sqlite3.OperationalError:
+                    rows = conn.execute("SELECT dir, name, size, checksum, NULL FROM files")
+                for dirid, name, size, checksum, algorithm in rows:
+                    yield (os.path.join(joined[dirid], name), size, checksum, algorithm)
+            finally:
+                conn.close()
+
+        return (meta, dirs, files())
@@ -0,0 +1,172 @@
+""" nfvmerkle.py implemented the hierarchical digest of a file tree
+
+:class NfvMerkle : per-directory node digests rolled up to the root of a tree
+
+NOTEs:
+- a directory node digests the (name, checksum) pairs of its own files and
+  the names and node digests of its sub directories
+- directories are keyed by the path relative to tree root, so trees under
+  different roots, e.g. a replica or a snapshot, are comparable
+- touching a directory invalidates its node and its ancestors only, the next
+  digest re-hashes those nodes and nothing else
+- a merkle is built over the file checksums of a single algorithm, merkles
+  of different algorithms never compare equal
+- the merkle knows nothing about NfvTree, NfvTree.digest/diff drive it
+"""
+
+import os
+
+from collections import defaultdict
+from hashlib import blake2b
+
+
+class NfvMerkle:
+    """ Merkle tree over the directories of a file tree
+    """
+    __slots__ = (
+            '_root',
+            '_algorithm',
+            '_files',
+            '_nodes',
+            '_children',
+            '_dirty',
+    )
+
+    _DIGEST_SIZE = 32
+
+    def __init__(self, tree_root=None, algorithm='md5'):
+        """ NfvMerkle constructor
+
+        :param tree_root : root path of the tree
+        :param algorithm : hash algorithm of the file checksums set
+        :return          : NfvMerkle object
+        """
+        if tree_root is None:
+            raise ValueError("ERROR: parameter tree_root is required!")
+        self._root = tree_root
+        self._algorithm = algorithm
+        self._files = {}                    # relative dir -> digest of its own files
+        self._nodes = {}                    # relative dir -> node digest, dropped once invalidated
+        self._children = defaultdict(set)   # relative dir -> relative sub dirs
+        self._dirty = {''}                  # relative dirs whose files digest is stale
+
+    @property
+    def algorithm(self):
+        """ hash algorithm of the file checksums
+        """
+        return self._algorithm
+
+    def relative(self, dir=None):
+        """ path of a directory relative to tree root
+
+        :param dir : path of the directory
+        :return    : relative path, '' for tree root itself
+        """
+        rel = os.path.relpath(dir, self._root)
+        return '' if rel == '.' else rel
+
+    def add_dir(self, dir=None):
+        """ add a directory, and its missing ancestors, into the merkle
+
+        :param dir : path of the directory
+        :return    : *none*
+        """
+        rel = self.relative(dir)
+        while rel and rel not in self._files and rel not in self._dirty:
+            self._dirty.add(rel)
+            parent = os.path.dirname(rel)
+            self._children[parent].add(rel)
+            self._invalidate(parent)
+            rel = parent
+
+    def touch(self, dir=None):
+        """ mark the files of a directory changed
+
+        :param dir : path of the directory
+        :return    : *none*
+        """
+        self.add_dir(dir)
+        rel = self.relative(dir)
+        self._dirty.add(rel)
+        self._invalidate(rel)
+
+    def _invalidate(self, rel=''):
+        """ drop node digests of a directory and all its ancestors
+
+        :param rel : relative path of the directory
+        :return    : *none*
+        """
+        while True:
+            self._nodes.pop(rel, None)
+            if not rel:
+                break
+            rel = os.path.dirname(rel)
+
+    def dirty_dirs(self):
+        """ directories whose files should be set before digest
+
+        :return : set of relative paths
+        """
+        return set(self._dirty)
+
+    def set_files(self, rel='', entries=()):
+        """ set the files of a directory
+
+        :param rel     : relative path of the directory
+        :param entries : iterable of (name, checksum) tuples
+        :return        : *none*
+        """
+        hasher = blake2b(digest_size=self._DIGEST_SIZE)
+        for name, checksum in sorted(entries):
+            hasher.update(('%s\0%s\n' % (name, checksum)).encode())
+        self._files[rel] = hasher.digest()
+        self._dirty.discard(rel)
+        self._invalidate(rel)
+
+    def digest(self, rel=''):
+        """ node digest of a directory, re-hash invalidated nodes only
+
+        :param rel : relative path of the directory, default to tree root
+        :return    : digest in bytes
+        """
+        node = self._nodes.get(rel)
+        if node is not None:
+            return node
+        if rel in self._dirty:
+            raise RuntimeError("ERROR: files of directory '%s' are not set!" % rel)
+        hasher = blake2b(self._files.get(rel, b''), digest_size=self._DIGEST_SIZE)
+        for child in sorted(self._children.get(rel, ())):
+            hasher.update(('%s\0' % os.path.basename(child)).encode())
+            hasher.update(self.digest(child))
+        node = self._nodes[rel] = hasher.digest()
+        return node
+
+    def hexdigest(self):
+        """ digest of the whole tree in hex
+
+        :return : hex string
+        """
+        return self.digest().hex()
+
+    def diff(self, other=None):
+        """ directories whose files differ from another merkle
+
+        only subtrees whose node digests differ are walked
+
+        :param other : NfvMerkle object to be compared with
+        :return      : list of relative paths
+        """
+        if other._algorithm != self._algorithm:
+            raise ValueError("ERROR: merkles of different algorithms are not comparable!")
+        dirs = []
+        stack = ['']
+        while stack:
+            rel = stack.pop()
+            mine = self.digest(rel) if rel in self._files else None
+            theirs = other.digest(rel) if rel in other._files else None
+            if mine is not None and mine == theirs:
+                continue
+            if self._files.get(rel) != other._files.get(rel):
+                dirs.append(rel)
+            stack.extend(self._children.get(rel, set()) | other._children.get(rel, set()))
+        return dirs
@@ -0,0 +1,152 @@
+""" nfvtrace.py implemented the timeline export of file operations
+
+:class NfvTrace : a hook of nfvhook, records events and saves them as a Chrome trace
+
+NOTEs:
+- the trace is in the trace event format of Chrome, which is loaded by
+  chrome://tracing, https://ui.perfetto.dev and speedscope alike
+- each process is a process track, each thread of it a thread track, so
+  every worker of a thread or process executor owns its own track
+- each event is a complete ('X') span named by its operation, file
+  operations ('file.new', 'block.write', ...) enclose the system calls
+  they make, the path, directory, offset and size are kept as arguments
+- events are kept in memory until saved, a long run is better recorded
+  with ops narrowed down, or saved and cleared in pieces
+- while used as a context manager, the trace is recorded within the block
+  and saved on exit, e.g.
+
+      with NfvTrace('create.json'):
+          tree.create_file(size='8k', number=100000)
+"""
+
+import os
+import json
+import threading
+
+from time import perf_counter_ns
+
+from nfv_tree.nfvhook import add_hook, remove_hook
+
+
+class NfvTrace:
+    """ recorder of the timeline of file operations
+    """
+    __slots__ = (
+            '_path',
+            '_ops',
+            '_begin',
+            '_events',
+    )
+
+    def __init__(self, path=None, ops=None):
+        """ NfvTrace constructor
+
+        :param path : path of the trace file to be saved by the context manager
+        :param ops  : operations to be recorded, either names ('write') or
+                      class prefixes ('file.'), default to every operation
+        :return     : NfvTrace object
+        """
+        self._path = path
+        self._ops = None if ops is None else tuple(ops)
+        self._begin = perf_counter_ns()
+        self._events = []   # (op, path, offset, size, start, end, pid, tid, error)
+
+    def __call__(self, event=None):
+        """ record a NfvEvent object, as a hook
+
+        :param event : NfvEvent object
+        :return      : *none*
+        """
+        if self._ops is not None and not event.op.startswith(self._ops):
+            return
+        self._events.append((event.op, event.path, event.offset, event.size, event.start, event.end, \
+                os.getpid(), threading.get_ident(), None if event.error is None else repr(event.error)))
+
+    def spawn(self):
+        """ an empty trace to be invoked by a worker process, see nfvhook
+
+        :return : NfvTrace object
+        """
+        return NfvTrace(ops=self._ops)
+
+    def merge(self, other=None):
+        """ add the events of another trace, e.g. the one of a worker process
+
+        :param other : NfvTrace object
+        :return      : self
+        """
+        self._events.extend(other._events)
+        return self
+
+    def clear(self):
+        """ drop the events recorded, the timeline starts over from now
+
+        :return : *none*
+        """
+        self._begin = perf_counter_ns()
+        self._events = []
+
+    def __len__(self):
+        return len(self._events)
+
+    def trace_events(self):
+        """ the events in trace event format
+
+        :yield : dict of each track name and each span
+        """
+        tracks = {}
+        for _, _, _, _, _, _, pid, tid, _ in self._events:
+            if (pid, tid) not in tracks:
+                tracks[(pid, tid)] = len(tracks)
+        pids = set()
+        for (pid, tid), worker in tracks.items():
+            if pid not in pids:
+                pids.add(pid)
+                yield {'ph': 'M', 'name': 'process_name', 'pid': pid, 'tid': 0, 'args': {'name': 'nfv %d' % pid}}
+            yield {'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tid, 'args': {'name': 'worker %d' % worker}}
+        begin = self._begin
+        for op, path, offset, size, start, end, pid, tid, error in self._events:
+            args = {'path': path, 'dir': os.path.dirname(path) if path else None, 'offset': offset, 'size': size}
+            if error is not None:
+                args['error'] = error
+            yield {'ph': 'X', 'name': op, 'cat': op.partition('.')[0] if '.' in op else 'syscall', \
+                    'ts': (start - begin) / 1000, 'dur': (end - start) / 1000, 'pid': pid, 'tid': tid, 'args': args}
+
+    def save(self, path=None):
+        """ save the trace into a JSON file
+
+        :param path : path of the trace file, default to the one given to constructor
+        :return     : number of spans saved
+        """
+        if path is None:
+            path = self._path
+        if path is None:
+            raise ValueError("ERROR: parameter path is required!")
+        # events are recorded in memory, only their JSON is written one by one
+        # rather than dumped as a single document, which would double the memory
+        with open(path, 'w') as fh:
+            fh.write('{"displayTimeUnit": "ms", "traceEvents": [\n')
+            first = True
+            for event in self.trace_events():
+                if not first:
+                    fh.write(',\n')
+                fh.write(json.dumps(event))
+                first = False
+            fh.write('\n]}\n')
+
+        return len(self._events)
+
+    def __enter__(self):
+        add_hook(self)
+        return self
+
+    def __exit__(self, *exc):
+        remove_hook(self)
+        if self._path is not None:
+            self.save()
+
+    def __getstate__(self):
+        return (self._path, self._ops, self._begin, self._events)
+
+    def __setstate__(self, state):
+        self._path, self._ops, self._begin, self._events = state
@@ -29,21 +29,54 @@ Layout of demo file tree:
 import os
 import sys
 import re
-import copy
+import errno
 
 import time
+import mmap
+import threading
 import logging
 import hashlib
 import string
 
 from random import Random
-from shutil import copyfile, move, rmtree
-from hashlib import md5
-from random import randint, shuffle
-from os import path, makedirs, listdir, walk, remove
-from os.path import isfile, isdir, exists, getsize, exists, join, getsize, split
+from shutil import move, rmtree
+from random import randint
+from os import path, makedirs, listdir, remove
+from os.path import isfile, exists, getsize, exists, join, getsize, split
 from collections import defaultdict
 from itertools import cycle
+from functools import partial
+from array import array
+from bisect import bisect_right
+
+# vectored writes are posix only, the number of buffers per call is capped by IOV_MAX
+_HAS_PWRITEV = hasattr(os, 'pwritev')
+try:
+    _IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    _IOV_MAX = 1024
+if _IOV_MAX <= 0:
+    _IOV_MAX = 1024
+
+# default read size of checksum, in line with the largest rsize of NFS clients
+_CHECKSUM_CHUNK = 1048576
+
+# copy engines in the order 'auto' tries them, copy_file_range lets the kernel
+# offload to the server (NFSv4.2 COPY) or reflink, sendfile stays in kernel, the
+# buffered one works everywhere, an engine falls back to the next one on these errors
+_COPY_ENGINES = tuple(e for e, available in (
+    ('copy_file_range', hasattr(os, 'copy_file_range')),
+    ('sendfile', hasattr(os, 'sendfile')),
+    ('buffered', True)) if available)
+_COPY_FALLBACK = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF}
+
+# NFV modules
+from nfv_tree.nfvexec import NfvExecutor, NfvExecReport
+from nfv_tree.nfvmanifest import NfvManifest
+from nfv_tree.nfvcache import NfvChecksumCache
+from nfv_tree.nfvmerkle import NfvMerkle
+from nfv_tree.nfvverify import NfvVerifyIndex, NfvStamp, digest_block, stamp_id, new_hash
+from nfv_tree.nfvhook import traced, hooked
 
 
 class NfvTree:
@@ -65,9 +98,15 @@ class NfvTree:
             '_dirlen',
             '_property',
             '_iotactic',
+            '_executor',
+            '_report',
+            '_manifest',
+            '_merkle',
+            '_dirindex',
     )
 
-    def __init__(self, tree_root=None, tree_width=0, tree_depth=0, dir_length=8, io_tactic=None):
+    def __init__(self, tree_root=None, tree_width=0, tree_depth=0, dir_length=8, io_tactic=None, executor=None, \
+                 lazy_load=False, scan_workers=0, catalog=False, manifest=None):
         """ Constructor for instaniating a empty file tree
 
         Each NfvTree object should have a set of attributes as below,
@@ -79,6 +118,17 @@ class NfvTree:
         :param tree_width : the width of file tree
         :param tree_depth : the depth of file tree
         :param dir_length : the length of a sub folder name
+        :param executor   : NfvExecutor object runs the bulk manipulations,
+                            files are manipulated one by one if it's None
+        :param lazy_load  : when loading an existing tree, defer building
+                            NfvFile objects until they are touched
+        :param scan_workers : number of threads scanning directories in
+                            parallel when loading an existing tree
+        :param catalog    : keep files in a compact NfvCatalog rather than
+                            a set of NfvFile objects, for million-file trees
+        :param manifest   : path of a manifest file, an existing tree is loaded
+                            from it if it's still fresh, otherwise the tree
+                            is walked and the manifest is saved afterwards
         :return           : NfvTree object
         """
         if tree_root is None:
@@ -90,18 +140,41 @@ class NfvTree:
             tree_depth = 1
         self._width = tree_width
         self._depth = tree_depth
-        self._files = set()
         self._dirs = set()
         self._treesize = 0 
+        self._filesperdir = {}
         self._dirlen = 0  
+        self._report = None
+        self._merkle = None
+        self._dirindex = None
 
         if io_tactic is None:
             self._iotactic = NfvIoTactic()
         else:
             self._iotactic = io_tactic
 
+        if catalog:
+            self._files = NfvCatalog(io_tactic=self._iotactic)
+        else:
+            self._files = set()
+
+        if executor is None:
+            self._executor = NfvExecutor()
+        else:
+            self._executor = executor
+
+        if manifest is None:
+            self._manifest = None
+        else:
+            self._manifest = NfvManifest(manifest)
+
         if exists(tree_root):
-            self.load_tree(self._root)
+            if self._manifest is not None and self._manifest.is_fresh(tree_root):
+                self.load_manifest(lazy=lazy_load)
+            else:
+                self.load_tree(self._root, lazy=lazy_load, scan_workers=scan_workers)
+                if self._manifest is not None:
+                    self.save_manifest()
         else:
             self.new(self._root, self._width, self._depth)
 
@@ -131,16 +204,92 @@ class NfvTree:
     def update(self):
         """ update some fundamental attributes of file tree
         
-        So far, only _treesize will be re-calcualted 
+        tree size and per-directory aggregates are maintained
+        incrementally by every manipulation, this method does
+        the full re-calculation on demand as a consistency check
+
+        :return : True if the incremental accounting was consistent
         """      
-        self._treesize = 0
+        treesize = 0
+        filesperdir = {}
         for f in self._files:
-            self._treesize += f.get_property('size')
+            stat = filesperdir.get(f._dir)
+            if stat is None:
+                stat = filesperdir[f._dir] = [0, 0]
+            stat[0] += 1
+            stat[1] += f._size
+            treesize += f._size
+        consistent = (treesize == self._treesize and filesperdir == \
+                {d: s for d, s in self._filesperdir.items() if s[0] > 0})
+        self._treesize = treesize
+        self._filesperdir = filesperdir
+
+        return consistent
+
+    def _invalidate(self):
+        """ the on-disk tree was changed, the manifest, if any, is out of date
+
+        :return : *none*
+        """
+        if self._manifest is not None:
+            self._manifest.invalidate()
+
+    def _account(self, file=None, sign=1):
+        """ add (or remove when sign is -1) a file to the size accounting
+
+        :param file : NfvFile object to be accounted
+        :param sign : 1 for a file added into tree, -1 for a file removed
+        :return     : *none*
+        """
+        stat = self._filesperdir.get(file._dir)
+        if stat is None:
+            stat = self._filesperdir[file._dir] = [0, 0]
+        stat[0] += sign
+        stat[1] += sign * file._size
+        self._treesize += sign * file._size
+        self._invalidate()
+        if self._merkle is not None:
+            self._merkle.touch(file._dir)
+        if self._dirindex is not None:
+            if sign > 0:
+                self._dirindex.setdefault(file._dir, {})[file._name] = file
+            else:
+                self._dirindex.get(file._dir, {}).pop(file._name, None)
+
+    def _resize(self, file=None, delta=0):
+        """ account the size change of a file already in tree
+
+        :param file  : NfvFile object been resized
+        :param delta : size changed in byte
+        :return      : *none*
+        """
+        self._filesperdir[file._dir][1] += delta
+        self._treesize += delta
+        self._invalidate()
+        if self._merkle is not None:
+            self._merkle.touch(file._dir)
+
+    def get_dir_stats(self, dir=None):
+        """ get the aggregates of files directly under a directory
+
+        :param dir : path of the directory, if it's None, aggregates
+                     of all directories will be returned
+        :return    : tuple of (file number, size in byte), or a dict
+                     maps each directory to such a tuple
+        """
+        if dir is None:
+            return {d: tuple(s) for d, s in self._filesperdir.items() if s[0] > 0}
+        return tuple(self._filesperdir.get(dir, (0, 0)))
         
     def create_file(self, size='8K', number=1, io_tactic=None):
         """ create file(s) with given io tactic 
         
         This method will create new on-disk file with user given tactic
+
+        :param size      : size of the file to be created
+        :param number    : number of files to be created
+        :param io_tactic : NfvIoTactic object to be set for I/O manipulations
+        :return          : NfvExecReport object
         """
         if io_tactic is None and self._iotactic is None: 
             raise ValueError("ERROR: need io_tactic specific before any I/O operation!")
@@ -149,57 +298,218 @@ class NfvTree:
         elif self._iotactic and io_tactic:
             self._iotactic = io_tactic
 
-        for _, dir in zip(range(number), cycle(self._dirs)):
-            self._files.add(NfvFile(path=join(dir, random_string(8)), size=size, io_tactic=self._iotactic))
-        
-        self.update()
+        if type(self._files) is not set:
+            self._files.set_tactic(self._iotactic)
+
+        def consume(result):
+            self._files.add(result[0])
+            self._account(result[0])
+
+        paths = (join(dir, random_string(8)) for _, dir in zip(range(number), cycle(self._dirs)))
+        report = self._executor.run(partial(_create_task, size, self._iotactic), paths, \
+                weigh=_weigh_file, consume=consume)
+
+        return self._settle(report)
+
+    def set_executor(self, executor=None):
+        """ set the executor for bulk manipulations of the file tree
+
+        :param executor : NfvExecutor object
+        :return         : *none*
+        """
+        if type(executor) is not NfvExecutor:
+            raise ValueError("ERROR: Given parameter executor is not NfvExecutor object!")
+        self._executor = executor
+
+    def _run(self, task=None, weigh=None, extra=None, touch=False, executor=None):
+        """ run task against every file of the tree through the executor
+
+        tasks return a tuple of (file, value, size before the task), the
+        returned file replaces the original one, since with 'process' 
+        executor it's a copy carries the changes made by the task, size
+        changes are accounted on the fly, the per-directory index of files
+        is rebuilt from the returned files as well
+
+        :param task  : callable object accepts a NfvFile object
+        :param weigh : callable object maps a task result to bytes it moved
+        :param extra : callable object accepts the new file container and
+                       each task result, for tasks which produce new files
+        :param touch : the task changes names or checksums of files, their
+                       directories are re-hashed by next digest, and the
+                       manifest is invalidated
+        :param executor : NfvExecutor object runs the task rather than the
+                       executor of the tree, it's shut down afterwards
+        :return      : NfvExecReport object
+        """
+        if type(self._files) is NfvCatalog:
+            files = self._files.spawn()
+        else:
+            files = set()
+        merkle = self._merkle if touch else None
+        if touch:
+            self._invalidate()
+        index = None
+        if self._dirindex is not None:
+            index = self._dirindex = {}
+
+        def consume(result):
+            f, _, size = result
+            files.add(f)
+            if index is not None:
+                index.setdefault(f._dir, {})[f._name] = f
+            if f._size != size:
+                self._resize(f, f._size - size)
+            elif merkle is not None:
+                merkle.touch(f._dir)
+            if extra is not None:
+                extra(files, result)
+
+        if executor is None:
+            report = self._executor.run(task, self._files, weigh=weigh, consume=consume)
+        else:
+            with executor:
+                report = executor.run(task, self._files, weigh=weigh, consume=consume)
+        for f, _ in report.get_property('failures'):
+            files.add(f)
+            if index is not None:
+                index.setdefault(f._dir, {})[f._name] = f
+        self._files = files
+
+        return report
 
-    def load_tree(self, tree_root=None):
+    def _settle(self, report=None):
+        """ keep the report of last bulk manipulation, raise if any file failed
+
+        :param report : NfvExecReport object
+        :return       : NfvExecReport object
+        """
+        self._report = report
+        return report.check()
+
+    def load_tree(self, tree_root=None, lazy=False, scan_workers=0):
         """ load an existing on-disk file tree into memory
 
         If given tree_root exists already, load the which
-        into memory instead of creating new one
+        into memory instead of creating new one, the tree is
+        scanned by os.scandir once, sizes come from the stat
+        results of directory entries and width/depth are
+        derived from the scan rather than listing dirs again,
+        directories which can't be scanned (e.g. unreadable or
+        removed meanwhile) are skipped as os.walk does, they're
+        logged and kept as failures of the report of the tree
 
-        :param tree_root : root path of file tree
-        :return          : NfvTree object
+        :param tree_root    : root path of file tree
+        :param lazy         : defer building NfvFile objects until they are touched
+        :param scan_workers : number of threads scanning directories in parallel,
+                              directories are scanned one by one if it's 0
+        :return             : NfvTree object
         """
 
         if not exists(tree_root):
             raise Exception("Given dir %s doesn't exist!" % tree_root)
         else:
             self._dirs.add(tree_root)
-        treedepth = 0
-        treewidth = 0
-        path = os.path.normpath(tree_root)
-        for dirpath, dirs, files in walk(tree_root, topdown=True):
-            for filename in files:
-                fullname = join(dirpath, filename)
-                self._files.add(NfvFile(path=fullname))
-            for dirname in dirs:
-                self._dirs.add(join(dirpath, dirname))
-        treelistgen = (f for f in listdir(tree_root) if isdir(join(tree_root, f)))
-        for _ in treelistgen:
-            treewidth += 1
+        if scan_workers > 0:
+            executor = NfvExecutor(mode='thread', workers=scan_workers)
+        else:
+            executor = NfvExecutor()
+        if lazy and type(self._files) is set:
+            self._files = NfvLazyFileSet(io_tactic=self._iotactic)
+        self._merkle = None
+        self._dirindex = None
+        subdirs = {}
+        skipped = NfvExecReport()
+        level = [tree_root]
+        while level:
+            report = executor.run(_scan_task, level)
+            for dir, error in report.get_property('failures'):
+                if dir == tree_root:
+                    executor.shutdown()
+                    raise error
+                logging.warning("directory %s is skipped, it can't be scanned: %s", dir, error)
+                skipped.add_failure(dir, error)
+            level = []
+            for dirpath, files, dirs in report.get_property('results'):
+                subdirs[dirpath] = dirs
+                dirsize = 0
+                for fullname, size in files:
+                    dirsize += size
+                    if type(self._files) is not set:
+                        self._files.defer(fullname, size)
+                    else:
+                        self._files.add(NfvFile.adopt(fullname, size, self._iotactic))
+                if files:
+                    stat = self._filesperdir.setdefault(dirpath, [0, 0])
+                    stat[0] += len(files)
+                    stat[1] += dirsize
+                    self._treesize += dirsize
+                self._dirs.update(dirs)
+                level.extend(dirs)
+        executor.shutdown()
         # recursively dive into immedia left child   
         # this strategy only works when the existing tree is standard NfvTree structure
-
-        def dive_dir(dir=None):
-            subdirs = [f for f in listdir(dir) if isdir(join(dir, f))]
-            while len(subdirs):
-                yield
-                dir = join(dir, subdirs[0])
-                subdirs = [f for f in listdir(dir) if isdir(join(dir, f))]
-
-        divegen = dive_dir(dir=tree_root)
-        for _ in divegen:
+        treedepth = 0
+        dir = tree_root
+        while subdirs.get(dir):
             treedepth += 1
-        self._width=treewidth
-        self._depth=treedepth
-        # initialize io tactic
-        for f in self._files:
-            f.set_tactic(self._iotactic)
+            dir = subdirs[dir][0]
+        self._width = len(subdirs[tree_root])
+        self._depth = treedepth
+        self._report = skipped
+
+        return self
+
+    def save_manifest(self, manifest=None):
+        """ save directories, files, sizes and checksums of the tree into a manifest
+
+        :param manifest : path of the manifest file, default to the one given
+                          on construction
+        :return         : number of files saved
+        """
+        if manifest is not None:
+            self._manifest = NfvManifest(manifest)
+        if self._manifest is None:
+            raise ValueError("ERROR: parameter manifest is required!")
+
+        return self._manifest.save(self._root, self._width, self._depth, self._dirs, \
+                ((f._path, f._size, f._checksum, f._algorithm) for f in self._files))
+
+    def load_manifest(self, manifest=None, lazy=False):
+        """ load the tree from a manifest instead of walking the on-disk tree
+
+        it trusts the manifest, use NfvManifest.is_fresh to check it beforehand
+
+        :param manifest : path of the manifest file, default to the one given
+                          on construction
+        :param lazy     : defer building NfvFile objects until they are touched
+        :return         : NfvTree object
+        """
+        if manifest is not None:
+            self._manifest = NfvManifest(manifest)
+        if self._manifest is None:
+            raise ValueError("ERROR: parameter manifest is required!")
+        meta, dirs, files = self._manifest.load(self._root)
+        if lazy and type(self._files) is set:
+            self._files = NfvLazyFileSet(io_tactic=self._iotactic)
+        self._merkle = None
+        self._dirindex = None
+        self._dirs.update(dirs)
+        for path, size, checksum, algorithm in files:
+            if type(self._files) is set:
+                f = NfvFile.adopt(path, size, self._iotactic)
+                f._checksum = checksum
+                f._algorithm = algorithm
+                self._files.add(f)
+            else:
+                self._files.defer(path, size, checksum, algorithm)
+            stat = self._filesperdir.setdefault(os.path.dirname(path), [0, 0])
+            stat[0] += 1
+            stat[1] += size
+            self._treesize += size
+        self._width = meta['width']
+        self._depth = meta['depth']
 
-        self.update()
+        return self
 
     def set_tactic(self, io_tactic=None):
         """ set io tactic for the file tree
@@ -213,6 +523,9 @@ class NfvTree:
         if type(io_tactic) is not NfvIoTactic:
             raise ValueError("ERROR: Given parameter tactic is not NfvIoTactic object!")
         self._iotactic = io_tactic
+        if type(self._files) is not set:
+            self._files.set_tactic(io_tactic)
+            return
         for f in self._files:
             f.set_tactic(io_tactic)
 
@@ -228,13 +541,14 @@ class NfvTree:
         """
         for f in range(number):
             try: 
-                self._files.pop().remove()
+                file = self._files.pop()
+                file.remove()
+                self._account(file, -1)
             except Exception as e:
                 if re.search('pop from an empty set', str(e)):
                     pass
                 else:
                     raise Exception(e)
-        self.update()
 
     def get_property(self, name=None):
         """ get the value of given property
@@ -252,6 +566,8 @@ class NfvTree:
             'tree_size'   : self._treesize,
             'file_number' : len(self._files),
             'dir_number'  : len(self._dirs),
+            'executor'    : self._executor,
+            'report'      : self._report,
         } 
 
         if name is None:
@@ -283,23 +599,20 @@ class NfvTree:
         if file_number < len(self._files):
             self.remove_file(number=deltanum)
 
-        self.update()
-
     def truncate(self, target_size=None):
         """ truncate the on-disk file tree to specific size
 
         :param target_size : size of each file to be truncated to
-        :return            : *none*
+        :return            : NfvExecReport object
         """
         if target_size is None:
             pass
         else:
             target_size = convert_size(target_size)
 
-        for f in self._files:
-            f.truncate(target_size)
+        report = self._run(partial(_file_task, 'truncate', (target_size,), {}), touch=True)
         
-        self.update()
+        return self._settle(report)
 
     def append(self, delta=None):
         """ append the on-disk file tree
@@ -311,69 +624,209 @@ class NfvTree:
         """
         pass
 
-    def copy(self, dest_tree=None, name_length=8, name_seed=None):
+    def copy(self, dest_tree=None, name_length=8, name_seed=None, engine='auto', copy_workers=0, \
+             hash_algorithm=None, verify=False):
         """ copy the on-disk files within tree to another path
 
-        :param dest_tree : destination path the file to be copied to,
-                           which will be auto created if doesn't exist.
-                           if dest_tree is None, all files will be copied within
-                           the file tree itself.
-        :return          : a copied NfvTree object or self with copied within self
-        """
+        :param dest_tree    : destination path the file to be copied to,
+                              which will be auto created if doesn't exist.
+                              if dest_tree is None, all files will be copied within
+                              the file tree itself.
+        :param engine       : copy engine of each file, see NfvFile.copy
+        :param copy_workers : number of threads copying files in parallel, the
+                              executor of the tree is used if it's 0
+        :param hash_algorithm : checksum files with it while copying, see NfvFile.copy
+        :param verify       : read copies back and compare their checksums
+        :return             : a copied NfvTree object or self with copied within self
+        """
+        if hash_algorithm is not None and engine not in ('auto', 'buffered'):
+            raise ValueError("ERROR: hashing while copying requires the buffered engine!")
+        if copy_workers > 0:
+            executor = NfvExecutor(mode='thread', workers=copy_workers)
+        else:
+            executor = None
         if dest_tree is None:
             dest_tree = self._root
-            tmpset = set()
-            for f in self._files:
-                tmpset.add(f.copy(name_length=name_length, name_seed=name_seed))
-            self._files = self._files.union(tmpset) 
-            self.update()
+
+            def adopt(files, result):
+                files.add(result[1])
+                self._account(result[1])
+
+            report = self._run(partial(_file_task, 'copy', (), {'name_length': name_length, 'name_seed': name_seed, \
+                    'engine': engine, 'hash_algorithm': hash_algorithm, 'verify': verify}), weigh=_weigh_file, \
+                    extra=adopt, executor=executor, touch=hash_algorithm is not None)
+            self._settle(report)
             return self
         else:
             makedirs(dest_tree)
             for d in self._dirs:
-                dstdir = d.replace(self._root, dest_tree)
+                dstdir = d.replace(self._root, dest_tree, 1)
                 if not exists(dstdir):
                     makedirs(dstdir)
-            desttree = NfvTree(tree_root=dest_tree)
+            desttree = NfvTree(tree_root=dest_tree, executor=self._executor, \
+                    catalog=type(self._files) is NfvCatalog)
             desttree._iotactic = self._iotactic
-            for f in self._files:
-                destpath = f._path.replace(self._root, dest_tree)
-                desttree._files.add(f.copy(destpath))
 
-            self.update()
+            def adopt(files, result):
+                desttree._files.add(result[1])
+                desttree._account(result[1])
+
+            report = self._run(partial(_copy_task, self._root, dest_tree, {'engine': engine, \
+                    'hash_algorithm': hash_algorithm, 'verify': verify}), weigh=_weigh_file, extra=adopt, \
+                    executor=executor, touch=hash_algorithm is not None)
+
+            self._settle(report)
             return  desttree
 
     def rename(self, name_seed=None, name_length=8):
         """ rename all on-disk file within file tree
 
         :param name_length : destination 
-        :return            : *none*
+        :return            : NfvExecReport object
         """
-        tmpset = set()
-        for f in self._files:
-            f.rename(name_length, name_seed)
+        report = self._run(partial(_file_task, 'rename', (name_length, name_seed), {}), touch=True)
         
-        self.update()
+        return self._settle(report)
 
-    def checksum(self):
+    def checksum(self, chunk_size=None, algorithm='md5', use_mmap=False, cache=None, force=False):
         """ checksum all the on-disk files within file tree
 
-        :return  : *none*
+        :param chunk_size : size of each chunk to be read, see NfvFile.checksum
+        :param algorithm  : hash algorithm, see NfvFile.checksum
+        :param use_mmap   : hash the memory mapped files rather than read them
+        :param cache      : NfvChecksumCache object or path of a cache file,
+                            only files changed since cached are read
+        :param force      : read every file regardless of the cache
+        :return           : NfvExecReport object
         """
+        if isinstance(cache, str):
+            cache = NfvChecksumCache(cache)
+        kwargs = {'chunk_size': chunk_size, 'algorithm': algorithm, 'use_mmap': use_mmap, \
+                'cache': cache, 'force': force}
+        return self._settle(self._run(partial(_file_task, 'checksum', (), kwargs), weigh=_weigh_file, touch=True))
+
+    def verify(self, generation=None):
+        """ verify all the on-disk files written with 'stamp' data pattern
+
+        :param generation : expected generation, default to the one of
+                            the first block of each file
+        :return           : NfvExecReport object
+        """
+        if self._iotactic is None:
+            raise ValueError("Error: parameter tactic is required!")
+
         for f in self._files:
-            f.checksum()
+            f.set_tactic(self._iotactic)
+        return self._settle(self._run(partial(_file_task, 'verify', (), {'generation': generation}), \
+                weigh=_weigh_file))
 
     def overwrite(self):
         """ overwrite the on-disk file tree
 
-        :return  : *none*
+        :return  : NfvExecReport object
         """
         if self._iotactic is None:
             raise ValueError("Error: parameter tactic is required!")
         
         for f in self._files:
             f.set_tactic(self._iotactic)
-            f.overwrite()
+        return self._settle(self._run(partial(_file_task, 'overwrite', (), {}), weigh=_weigh_file, touch=True))
+
+    def digest(self, algorithm='md5', cache=None):
+        """ hierarchical digest of the tree
+
+        every directory has a node digest of its own files and sub directories
+        rolled up to the root, the nodes are maintained incrementally, only
+        directories touched since last digest are re-hashed, files without
+        checksum, or with a checksum of another algorithm, are checksummed
+        with given algorithm through the executor, a digest of another
+        algorithm than the last one starts over from scratch
+
+        :param algorithm : hash algorithm of missing file checksums
+        :param cache     : NfvChecksumCache object or path of a cache file
+        :return          : hex digest of the tree root
+        """
+        if self._merkle is None or self._merkle.algorithm != algorithm:
+            self._merkle = NfvMerkle(self._root, algorithm)
+            for d in self._dirs:
+                self._merkle.add_dir(d)
+        dirty = self._merkle.dirty_dirs()
+        if dirty:
+            for rel, entries in self._collect(dirty, algorithm, cache).items():
+                self._merkle.set_files(rel, entries.items())
+
+        return self._merkle.hexdigest()
+
+    def diff(self, other_tree=None, algorithm='md5', cache=None):
+        """ compare with another tree by the hierarchical digest
+
+        only subtrees whose node digests differ are walked, only files in
+        directories whose own files differ are compared one by one
+
+        :param other_tree : NfvTree object to be compared with, e.g. a replica
+        :param algorithm  : hash algorithm of missing file checksums
+        :param cache      : NfvChecksumCache object or path of a cache file
+        :return           : sorted list of relative paths of files which are
+                            changed, or exist in one tree only
+        """
+        if self.digest(algorithm, cache) == other_tree.digest(algorithm, cache):
+            return []
+        dirs = set(self._merkle.diff(other_tree._merkle))
+        mine = self._collect(dirs, algorithm, cache)
+        theirs = other_tree._collect(dirs, algorithm, cache)
+        changed = []
+        for rel in dirs:
+            a, b = mine.get(rel, {}), theirs.get(rel, {})
+            changed.extend(join(rel, name) for name in a.keys() | b.keys() if a.get(name) != b.get(name))
+
+        return sorted(changed)
+
+    def _collect(self, dirs=(), algorithm='md5', cache=None):
+        """ checksums of the files directly under given directories
+
+        files are looked up by the per-directory index, which is built on first
+        use and kept by later manipulations, so the cost is proportional to the
+        files of given directories only, a catalog keeps no index to stay compact
+        and is walked as a whole instead
+
+        :param dirs      : set of directory paths relative to tree root
+        :param algorithm : hash algorithm of missing file checksums
+        :param cache     : NfvChecksumCache object or path of a cache file
+        :return          : dict maps each directory to a {name: checksum} dict
+        """
+        if isinstance(cache, str):
+            cache = NfvChecksumCache(cache)
+        entries = {rel: {} for rel in dirs}
+        relatives = {}
+        missing = []
+        if type(self._files) is NfvCatalog:
+            candidates = self._files
+        else:
+            if self._dirindex is None:
+                self._dirindex = {}
+                for f in self._files:
+                    self._dirindex.setdefault(f._dir, {})[f._name] = f
+            candidates = (f for d, named in self._dirindex.items() \
+                    if self._merkle.relative(d) in entries for f in named.values())
+        for f in candidates:
+            rel = relatives.get(f._dir)
+            if rel is None:
+                rel = relatives[f._dir] = self._merkle.relative(f._dir)
+            if rel in entries:
+                # a checksum of another algorithm is never mixed in
+                if f._checksum is None or f._algorithm != algorithm:
+                    missing.append(f)
+                else:
+                    entries[rel][f._name] = f._checksum
+
+        def consume(result):
+            f, checksum, _ = result
+            entries[relatives[f._dir]][f._name] = checksum
+
+        kwargs = {'algorithm': algorithm, 'cache': cache}
+        self._executor.run(partial(_file_task, 'checksum', (), kwargs), missing, consume=consume).check()
+
+        return entries
 
     def read(self):
         """ read the data of on-disk file
@@ -381,10 +834,9 @@ class NfvTree:
         read all files within file tree with io_size 
         and seek type specified in io tactic object
 
-        :return  : *none*
+        :return  : NfvExecReport object
         """
-        for f in self._files:
-            f.read()
+        return self._settle(self._run(partial(_file_task, 'read', (), {}), weigh=_weigh_file))
     
     def clear_file(self):
         """ clear all on-disk files within tree
@@ -395,6 +847,7 @@ class NfvTree:
             while True:
                 f = self._files.pop()
                 f.remove()
+                self._account(f, -1)
         except KeyError as e:
             if re.search('pop from an empty set', str(e)):
                 pass
@@ -409,6 +862,11 @@ class NfvTree:
         for f in self._files:
             f.remove()
         self._files = {}
+        self._treesize = 0
+        self._filesperdir = {}
+        self._merkle = None
+        self._dirindex = None
+        self._invalidate()
         # clear dirs
         rmtree(self._root)
         self._dirs = {}
@@ -426,6 +884,12 @@ class NfvTree:
 
    
 
+def _file_span(file):
+    """ (path, offset, size) of the events of NfvFile operations, see nfvhook
+    """
+    return (file._path, 0, file._size)
+
+
 class NfvFile:
     """ represent a file object
     """
@@ -435,14 +899,13 @@ class NfvFile:
             '_dir', 
             '_name', 
             '_checksum', 
+            '_algorithm',
             '_iotactic', 
             '_adsstreams',
             '_lockmgr',
             '_locks',
     )
 
-    _io_check_db = defaultdict(lambda : None)
-
     def __init__(self, path=None, size='8k', io_tactic=None):
         """ initialize a NfvFile object
 
@@ -456,6 +919,7 @@ class NfvFile:
         self._path = path 
         self._size = convert_size(size)
         self._checksum = None
+        self._algorithm = None
         self._iotactic = io_tactic
         self._dir, self._name = os.path.split(path)
         self._adsstreams = {} 
@@ -466,57 +930,208 @@ class NfvFile:
         else:
             self.load_file(path)
 
+    @classmethod
+    def adopt(cls, path=None, size=0, io_tactic=None):
+        """ wrap an existing on-disk file whose size is known already
+
+        unlike the constructor, it doesn't touch the file system at all,
+        which saves a stat per file when the size comes from a directory scan
+
+        :param path      : path of the on-disk file
+        :param size      : size of the on-disk file in byte
+        :param io_tactic : NfvIoTactic object to be used for I/O operation
+        :return          : NfvFile object
+        """
+        if path is None:
+            raise ValueError("Error: parameter file_path is required!")
+        file = cls.__new__(cls)
+        file._path = path
+        file._size = size
+        file._checksum = None
+        file._algorithm = None
+        file._iotactic = io_tactic
+        file._dir, file._name = os.path.split(path)
+        file._adsstreams = {}
+        file._locks = set()
+
+        return file
+
+    @hooked('file.new', _file_span)
     def new(self, open_mode='create'):
         """ craete a NfvFile on-disk file object
-        :return : *none*
+
+        data is written on a raw fd, offsets supplied by seek_to which 
+        are adjacent in ascending order are grouped (up to batch_depth
+        of io tactic) and written by a single pwritev call, each I/O 
+        still carries io_size of data, with direct_io of io tactic the
+        file is opened with O_DIRECT and written from aligned buffers,
+        with 'stamp' data pattern every block is generated for its own
+        offset and verified by regenerating it, nothing is recorded, with
+        write_hash of io tactic the checksum is computed from the data being
+        written, which requires 'sequencial' seek type over the whole file,
+        otherwise the file is read back for it, with fsync of io tactic the
+        data is flushed to stable storage before the file is closed
+
+        :param open_mode : 'create' truncates the file, 'overwrite' keeps it
+        :return          : *none*
         """
         if self._iotactic is None:
             raise ValueError("Error: parameter tactic is required!")
-        openmode = 'w+b' 
-        if open_mode == 'overwrite':
-            openmode = 'rb+'
-        numwrite = self._size // self._iotactic.get_property('io_size')
-        remainder = self._size % self._iotactic.get_property('io_size')
-        indexsupplier = self._iotactic.seek_to(file_size=self._size)
-        if remainder > 0:
-            rindex = next(indexsupplier)
-        with open(self._path, openmode) as fh:
-            if remainder > 0 and self._iotactic._seek == 'reverse':
-                data = self._iotactic.get_data_pattern()
-                if self._iotactic._datacheck:
-                    NfvFile._io_check_db[encipher_data(data, NfvFile._io_check_db)] = True
-                fh.seek(rindex)
-                fh.write(data[:remainder])
-            for idx in indexsupplier:
-                data = self._iotactic.get_data_pattern()
-                if self._iotactic._datacheck:
-                    NfvFile._io_check_db[encipher_data(data, NfvFile._io_check_db)] = True
-                fh.seek(idx)
-                fh.write(data)
-            if remainder > 0 and (self._iotactic._seek == 'sequencial' or self._iotactic._seek == 'random'):
-                data = self._iotactic.get_data_pattern()
-                if self._iotactic._datacheck:
-                    NfvFile._io_check_db[encipher_data(data, NfvFile._io_check_db)] = True
-                fh.seek(rindex)
-                fh.write(data[:remainder])
-
-        if self._iotactic._datacheck:
-            self._verify_file()
+        flags = os.O_RDWR | getattr(os, 'O_BINARY', 0)
+        if open_mode != 'overwrite':
+            flags |= os.O_CREAT | os.O_TRUNC
+        tactic = self._iotactic
+        iosize = tactic.get_property('io_size')
+        # the data changes, so does its checksum
+        self._checksum = None
+        # I/Os are paced one by one when target rates are set
+        depth = 1 if tactic._throttle is not None else tactic.get_property('batch_depth')
+        stamped = tactic._datapattern == 'stamp'
+        datacheck = tactic._datacheck and not stamped
+        borrowed = []
+        hasher = None
+        if tactic._writehash is not None and tactic._seek == 'sequencial' and tactic.covers_range(self._size):
+            hasher = new_hash(tactic._writehash)
+        if stamped:
+            fileid = self.file_id
+            if tactic._directio:
+                pool = tactic.get_buffer_pool()
+            def supply(offset, length):
+                data = tactic.stamp_data(fileid, offset, length)
+                if not tactic._directio:
+                    return (data, None)
+                buf = pool.acquire()
+                buf[:length] = data
+                borrowed.append(buf)
+                return (buf, None)
+        elif tactic._directio:
+            getdata = tactic.get_buffer_pool().get_data
+            def supply(offset, length):
+                return getdata()
+        else:
+            def supply(offset, length):
+                return (tactic.get_data_pattern(), None)
+        if tactic._directio:
+            tactic.check_alignment(self._size)
+            flags |= os.O_DIRECT
+
+        def flush(buffers, offset, size):
+            traced('write', self._path, offset, size, write_at, fd, buffers, offset)
+            while borrowed:
+                pool.release(borrowed.pop())
+
+        # verify index is private to each call, so that files could be
+        # written and verified concurrently by executor workers
+        if datacheck:
+            checkindex = NfvVerifyIndex(self._size, iosize)
+        fd = traced('open', self._path, 0, 0, os.open, self._path, flags, 0o666)
+        try:
+            batch = []
+            batchstart = 0
+            for offset, length in tactic.seek_requests(file_size=self._size):
+                tactic.pace(length)
+                if batch and (length < iosize or len(batch) >= depth \
+                        or offset != batchstart + len(batch) * iosize):
+                    flush(batch, batchstart, len(batch) * iosize)
+                    batch = []
+                data, digest = supply(offset, length)
+                if hasher is not None:
+                    hasher.update(memoryview(data)[:length])
+                if datacheck:
+                    if length < iosize:
+                        checkindex.record(offset, memoryview(data)[:length])
+                    else:
+                        checkindex.record(offset, data, digest)
+                if length < iosize:
+                    flush([memoryview(data)[:length]], offset, length)
+                    continue
+                if not batch:
+                    batchstart = offset
+                batch.append(data)
+            if batch:
+                flush(batch, batchstart, len(batch) * iosize)
+            # skewed seek types and io regions leave blocks unwritten
+            if open_mode != 'overwrite' and not tactic.covers_range(self._size):
+                os.ftruncate(fd, self._size)
+            if tactic._fsync:
+                traced('fsync', self._path, 0, self._size, os.fsync, fd)
+        finally:
+            os.close(fd)
+
+        if hasher is not None:
+            self._checksum = hasher.hexdigest()
+            self._algorithm = tactic._writehash
+        elif tactic._writehash is not None:
+            self.checksum(algorithm=tactic._writehash)
+        if datacheck:
+            self._verify_file(checkindex)
+        elif stamped and tactic._datacheck:
+            self.verify(file_id=fileid, generation=tactic._generation)
    
-    def _verify_file(self):
+    def _verify_file(self, check_index=None):
         """ verfiy the data of on-disk file (do not use it directly on a NfvFile object)
-        :return : *none*
+
+        blocks are read back sequentially and each one is compared with
+        the digest recorded for its own offset
+
+        :param check_index : NfvVerifyIndex object recorded while writing
+        :return            : *none*
         """
-        numread = self._size // self._iotactic.get_property('io_size')
-        with open(self._path, 'rb') as fh:
-            while numread > 0:
-                if not NfvFile._io_check_db[encipher_data(fh.read(self._iotactic._iosize))]:
-                    print('database dump: %s' % NfvFile._io_check_db)
-                    raise Exception("ERROR: data check failed!")
-                numread -= 1
+        offsets = (offset for offset, _ in check_index.requests())
+        failures = check_index.verify_stream(zip(offsets, self._fetch(check_index.requests(), paced=False)))
+        if failures:
+            raise Exception("ERROR: data check failed on %s at %d block(s), first offset: %d" \
+                    % (self._path, len(failures), failures[0]))
 
-        # rest db to release resource 
-        NfvFile._io_check_db = {}
+    @property
+    def file_id(self):
+        """ id stamped into blocks of 'stamp' data pattern, derived from file name
+
+        :return : 64-bit integer
+        """
+        return stamp_id(self._name)
+
+    def verify(self, file_id=None, generation=None, allow_holes=None):
+        """ verify the on-disk file written with 'stamp' data pattern
+
+        every block is read back sequentially and compared with the one
+        regenerated from its header, no state of the write is required,
+        file id and generation default to the ones of the first block,
+        so that misdirected and stale blocks are still detected
+
+        :param file_id     : expected file id
+        :param generation  : expected generation
+        :param allow_holes : accept blocks of zeros, which are never written,
+                             default to True for skewed seek types and io regions
+        :return            : number of blocks verified
+        """
+        if self._iotactic is None or self._iotactic._datapattern != 'stamp':
+            raise ValueError("ERROR: verify requires io tactic of 'stamp' data pattern!")
+        if allow_holes is None:
+            allow_holes = not self._iotactic.covers_range(self._size)
+        stamp = self._iotactic.get_stamp()
+        iosize = self._iotactic.get_property('io_size')
+        requests = ((offset, min(iosize, self._size - offset)) for offset in range(0, self._size, iosize))
+        count = failed = 0
+        first = None
+        for offset, data in zip(range(0, self._size, iosize), self._fetch(requests, paced=False)):
+            count += 1
+            if file_id is None or generation is None:
+                header = stamp.parse(data)
+                if header is not None:
+                    file_id = header[1] if file_id is None else file_id
+                    generation = header[3] if generation is None else generation
+            reason = stamp.check(data, offset, file_id, generation)
+            if reason is not None and not (allow_holes and data == bytes(len(data))):
+                # failures are counted, a badly corrupted file never piles them up
+                failed += 1
+                if first is None:
+                    first = (offset, reason)
+        if failed:
+            raise Exception("ERROR: data check failed on %s at %d block(s), first offset: %d (%s)" \
+                    % (self._path, failed, first[0], first[1]))
+
+        return count
 
     def load_file(self, path):
         """ load an existing on-disk file and initialize a NfvFile object
@@ -526,6 +1141,7 @@ class NfvFile:
         """
         self._size = getsize(path) 
         self._dir, self._name = os.path.split(path)
+        self._checksum = None
 
     def get_property(self, name=None):
         """ get the value of given property
@@ -539,6 +1155,8 @@ class NfvFile:
                 'size'       : self._size,
                 'directory'  : self._dir,
                 'checksum'   : self._checksum,
+                'algorithm'  : self._algorithm,
+                'file_id'    : self.file_id,
         }
 
         if name is None:
@@ -570,27 +1188,73 @@ class NfvFile:
             size = convert_size(size)
             with open(self._path, 'ab') as fh:
                 fh.truncate(size)
+            self._checksum = None
 
         self._size = getsize(self._path) 
 
-    def copy(self, dest_path=None, name_length=8, name_seed=None):
+    @hooked('file.copy', _file_span)
+    def copy(self, dest_path=None, name_length=8, name_seed=None, engine='auto', hash_algorithm=None, \
+             verify=False):
         """ copy the on-disk file to another path
 
-        :param dest_path : destination path the file to be copied to, if it's not 
-                           provided, use current dir as destination  folder
-        :return          : NfvFile object just been copied
-        """
+        data is copied by the kernel where it's possible, see copy_data,
+        size and checksum are carried over to the new NfvFile object
+        without looking at the destination again, with hash_algorithm the
+        checksum is computed from the data being copied instead, which
+        takes the buffered engine since data has to pass through, an
+        explicit kernel engine is refused then
+
+        :param dest_path      : destination path the file to be copied to, if it's not 
+                                provided, use current dir as destination  folder
+        :param engine         : 'auto', 'copy_file_range', 'sendfile' or 'buffered'
+        :param hash_algorithm : hash algorithm of the checksum computed while copying
+        :param verify         : read the copy back and compare its checksum, with
+                                the one computed while copying, or with the one
+                                known of source, or else with the md5 of source
+        :return               : NfvFile object just been copied
+        """
+        hasher = None
+        if hash_algorithm is not None:
+            if engine not in ('auto', 'buffered'):
+                raise ValueError("ERROR: hashing while copying requires the buffered engine!")
+            hasher = new_hash(hash_algorithm)
         if dest_path is None:
-            dest_path = join(self._dir, random_string(8))
+            dest_path = join(self._dir, random_string(name_length, name_seed))
+        srcfd = traced('open', self._path, 0, 0, os.open, self._path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
         try:
-            cfile = copy.deepcopy(self)
-            copyfile(self._path, dest_path)
-            cfile = NfvFile(dest_path)
-        except Exception as e:
-            raise Exception(e)
+            dstfd = traced('open', dest_path, 0, 0, os.open, dest_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC \
+                    | getattr(os, 'O_BINARY', 0), 0o666)
+            try:
+                srcsize = os.fstat(srcfd).st_size
+                size = copy_data(srcfd, dstfd, srcsize, engine, hasher)[0]
+            finally:
+                os.close(dstfd)
+        finally:
+            os.close(srcfd)
+        cfile = NfvFile.adopt(dest_path, size, self._iotactic)
+        if hasher is not None:
+            cfile._checksum = hasher.hexdigest()
+            cfile._algorithm = hash_algorithm
+            self._checksum = cfile._checksum
+            self._algorithm = hash_algorithm
+        elif size == self._size:
+            cfile._checksum = self._checksum
+            cfile._algorithm = self._algorithm
+        if verify:
+            if hasher is not None:
+                expected, algorithm = cfile._checksum, hash_algorithm
+            elif self._checksum is not None and self._algorithm is not None:
+                expected, algorithm = self._checksum, self._algorithm
+            else:
+                # a stand-in, the checksum of source is left as it was
+                algorithm = 'md5'
+                expected = NfvFile.adopt(self._path, self._size, self._iotactic).checksum(algorithm=algorithm)
+            if cfile.checksum(algorithm=algorithm) != expected:
+                raise Exception("ERROR: copy %s of %s doesn't match its source!" % (dest_path, self._path))
            
         return cfile
 
+    @hooked('file.rename', _file_span)
     def rename(self, name_length=8, name_seed=None):
         """ move on-disk file to another path
 
@@ -599,9 +1263,11 @@ class NfvFile:
         :return            : *none*
         """
         try:
-            newpath = join(self._dir, random_string(name_length, name_seed))
-            move(self._path, newpath)
+            newname = random_string(name_length, name_seed)
+            newpath = join(self._dir, newname)
+            traced('rename', self._path, 0, self._size, move, self._path, newpath)
             self._path = newpath
+            self._name = newname
         except Exception as e:
             raise Exception(e)
 
@@ -610,49 +1276,108 @@ class NfvFile:
 
         :return  :  NfvFile object just been rewrote
         """
+        algorithm = self._algorithm if self._checksum is not None else None
         self.new(open_mode='overwrite')
-        # update checksum
-        if self._checksum is not None:
-            self.checksum()
+        # update checksum, unless it's computed while writing
+        if algorithm is not None and self._iotactic._writehash is None:
+            self.checksum(algorithm=algorithm)
 
+    @hooked('file.read', _file_span)
     def read(self):
         """ read the data of on-disk file
 
         :return  : *none*
         """
-        numread = self._size // self._iotactic._iosize
-        remainder = self._size % self._iotactic._iosize
-
-        indexsupplier = self._iotactic.seek_to(self._size)
-        if remainder > 0:
-            rindex = next(index_supplier) # get index of remainder
-        with open(self._path, 'rb') as fh:
-            if remainder > 0 and self._iotactic.get_property('seek-type') == 'reverse':
-                fh.seek(rindex)
-                fh.read(remainder)
-            for idx in indexsupplier:
-                fh.seek(idx)
-                fh.read(self._iotactic._iosize)
-            if remainder > 0 and (self._iotactic.get_property('seek-type') == 'sequencial'\
-                    or self._iotactic.get_property('seek-type') == 'random'):
-                fh.seek(rindex)
-                fh.read(remainder)
-
-    def checksum(self, chunk_size=4096):
-        """ checksum the data of on-disk file
-        
-        :param chunck_size : size of each chunck to be read for md5
-        :return            : checksum value  
-        """
-        if chunk_size > self._size:
-            chunk_size = self._size
+        for _ in self._fetch(self._iotactic.seek_requests(file_size=self._size)):
+            pass
 
-        hashmd5 = md5()
-        with open(self._path, 'rb') as fh:
-            for chunk in iter(lambda : fh.read(chunk_size), b""):
-                hashmd5.update(chunk)
+    def _fetch(self, requests=None, paced=True):
+        """ read given byte ranges of on-disk file (do not use it directly on a NfvFile object)
+
+        with direct_io of io tactic, the file is opened with O_DIRECT and
+        read into an aligned buffer borrowed from the buffer pool, the 
+        chunk yielded is only valid until the next one
+
+        :param requests : iterable object supplies (offset, length) tuples
+        :param paced    : pace reads to the target rates of io tactic, reads
+                          verifying the data are not part of the workload
+        :yield          : data of each range
+        """
+        pace = self._iotactic.pace if paced else None
+        if not self._iotactic._directio:
+            with traced('open', self._path, 0, 0, open, self._path, 'rb') as fh:
+                for offset, length in requests:
+                    if pace is not None:
+                        pace(length)
+                    fh.seek(offset)
+                    yield traced('read', self._path, offset, length, fh.read, length)
+            return
+        self._iotactic.check_alignment(self._size)
+        pool = self._iotactic.get_buffer_pool()
+        buf = pool.acquire()
+        fd = traced('open', self._path, 0, 0, os.open, self._path, os.O_RDONLY | os.O_DIRECT)
+        try:
+            view = memoryview(buf)
+            for offset, length in requests:
+                if pace is not None:
+                    pace(length)
+                yield view[:traced('read', self._path, offset, length, os.preadv, fd, [view[:length]], offset)]
+        finally:
+            view.release()
+            os.close(fd)
+            pool.release(buf)
+
+    @hooked('file.checksum', _file_span)
+    def checksum(self, chunk_size=None, algorithm='md5', use_mmap=False, cache=None, force=False):
+        """ checksum the data of on-disk file
 
-        self._checksum = hashmd5.hexdigest()
+        chunks are read into a single buffer reused by every read, with 
+        use_mmap the file is mapped and hashed in place without any copy,
+        with cache the file is not read at all if it's unchanged since its
+        checksum was cached
+        
+        :param chunk_size : size of each chunk to be read, default to 1MB
+                            (or the file size if it's smaller)
+        :param algorithm  : hash algorithm, either 'crc32', 'adler32' or
+                            any of hashlib, such as 'sha1' and 'blake2b'
+        :param use_mmap   : hash the memory mapped file rather than read it
+        :param cache      : NfvChecksumCache object consulted before reading
+        :param force      : read the file even if its checksum is cached
+        :return           : checksum value  
+        """
+        if cache is not None and not force:
+            checksum = cache.get(os.stat(self._path), algorithm)
+            if checksum is not None:
+                self._checksum = checksum
+                self._algorithm = algorithm
+                return self._checksum
+        if chunk_size is None:
+            chunk_size = min(_CHECKSUM_CHUNK, max(self._size, 1))
+        else:
+            chunk_size = max(convert_size(chunk_size), 1)
+        hasher = new_hash(algorithm)
+
+        with traced('open', self._path, 0, 0, open, self._path, 'rb', 0) as fh:
+            stat = os.fstat(fh.fileno())
+            size = stat.st_size
+            if use_mmap and size > 0:
+                with mmap.mmap(fh.fileno(), size, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                    for offset in range(0, size, chunk_size):
+                        hasher.update(view[offset:offset+chunk_size])
+            else:
+                with memoryview(bytearray(chunk_size)) as view:
+                    offset = 0
+                    while True:
+                        length = traced('read', self._path, offset, chunk_size, fh.readinto, view)
+                        if not length:
+                            break
+                        hasher.update(view[:length])
+                        offset += length
+
+        self._checksum = hasher.hexdigest()
+        self._algorithm = algorithm
+        if cache is not None:
+            cache.put(stat, algorithm, self._checksum)
         return self._checksum
 
     def remove(self):
@@ -661,7 +1386,7 @@ class NfvFile:
         :return  : *none*
         """
         try: 
-            os.remove(self._path)
+            traced('unlink', self._path, 0, self._size, os.remove, self._path)
         except IOError as e:
             raise IOError(e)
         
@@ -725,6 +1450,872 @@ class NfvFile:
                     pass 
        
 
+class NfvLazyFileSet:
+    """ a set of NfvFile objects which are built only when touched
+
+    NfvTree uses it in place of a plain set when loading a huge 
+    existing tree lazily, each deferred file costs a path and a size
+    until it's iterated or popped, then it becomes a regular NfvFile
+    """
+    __slots__ = (
+            '_files',
+            '_pending',
+            '_iotactic',
+    )
+
+    def __init__(self, io_tactic=None):
+        """ initialize an empty set
+
+        :param io_tactic : NfvIoTactic object set on files once they are built
+        :return          : NfvLazyFileSet object
+        """
+        self._files = set()
+        self._pending = {}
+        self._iotactic = io_tactic
+
+    def defer(self, path=None, size=0, checksum=None, algorithm=None):
+        """ record an on-disk file without building its NfvFile object
+
+        :param path      : path of the on-disk file
+        :param size      : size of the on-disk file in byte
+        :param checksum  : checksum of the file, if any
+        :param algorithm : hash algorithm of the checksum
+        :return          : *none*
+        """
+        if checksum is None:
+            self._pending[path] = size
+        else:
+            self._pending[path] = (size, checksum, algorithm)
+
+    def set_tactic(self, io_tactic=None):
+        """ set io tactic on built files and on files to be built
+
+        :param io_tactic : NfvIoTactic object
+        :return          : *none*
+        """
+        self._iotactic = io_tactic
+        for f in self._files:
+            f.set_tactic(io_tactic)
+
+    def _build(self, path, size):
+        if type(size) is tuple:
+            size, checksum, algorithm = size
+            f = NfvFile.adopt(path, size, self._iotactic)
+            f._checksum = checksum
+            f._algorithm = algorithm
+            return f
+        return NfvFile.adopt(path, size, self._iotactic)
+
+    def add(self, file):
+        self._files.add(file)
+
+    def update(self, files):
+        self._files.update(files)
+
+    def discard(self, file):
+        self._files.discard(file)
+
+    def remove(self, file):
+        self._files.remove(file)
+
+    def pop(self):
+        """ pop a file, deferred files go first since they are cheap to hand out
+        """
+        if self._pending:
+            return self._build(*self._pending.popitem())
+        if not self._files:
+            raise KeyError('pop from an empty set')
+        return self._files.pop()
+
+    def clear(self):
+        self._files.clear()
+        self._pending.clear()
+
+    def __contains__(self, file):
+        return file in self._files
+
+    def __len__(self):
+        return len(self._files) + len(self._pending)
+
+    def __iter__(self):
+        """ iterate all files, deferred files are built as they are reached
+        """
+        for f in list(self._files):
+            yield f
+        while self._pending:
+            f = self._build(*self._pending.popitem())
+            self._files.add(f)
+            yield f
+
+
+class NfvCatalog:
+    """ a compact, array backed catalog of files
+
+    NfvTree uses it in place of a set of NfvFile objects when it's
+    told so, each file is stored as a row of columnar arrays
+    (directory id, name, size and checksum digest) with directory
+    paths interned in a table, NfvFile objects are built as views
+    on demand, and changes made on a view are only kept when the 
+    view is added back (which NfvTree does after each manipulation)
+
+    NOTEs:
+    - ADS streams and locks of a view are not kept in the catalog
+    - removing a file moves the last row into its place
+    """
+    __slots__ = (
+            '_dirtable',
+            '_dirids',
+            '_dir',
+            '_name',
+            '_size',
+            '_digest',
+            '_digestlen',
+            '_digestwidth',
+            '_algorithm',
+            '_algotable',
+            '_iotactic',
+    )
+
+    def __init__(self, io_tactic=None, dir_table=None):
+        """ initialize an empty catalog
+
+        :param io_tactic : NfvIoTactic object set on the NfvFile views
+        :param dir_table : a (table, ids) tuple of interned directories to be shared
+        :return          : NfvCatalog object
+        """
+        if dir_table is None:
+            dir_table = ([], {})
+        self._dirtable, self._dirids = dir_table
+        self._dir = array('L')
+        self._name = []
+        self._size = array('q')
+        self._digest = bytearray()
+        self._digestlen = array('B')
+        self._digestwidth = 16
+        self._algorithm = array('B')
+        self._algotable = [None]    # algorithms of checksums interned, ids are kept per row
+        self._iotactic = io_tactic
+
+    def spawn(self):
+        """ create an empty catalog sharing the directory table and io tactic
+
+        :return : NfvCatalog object
+        """
+        return NfvCatalog(io_tactic=self._iotactic, dir_table=(self._dirtable, self._dirids))
+
+    def set_tactic(self, io_tactic=None):
+        """ set io tactic on the NfvFile views to be built
+
+        :param io_tactic : NfvIoTactic object
+        :return          : *none*
+        """
+        self._iotactic = io_tactic
+
+    def defer(self, path=None, size=0, checksum=None, algorithm=None):
+        """ record an on-disk file as a new row
+
+        :param path      : path of the on-disk file
+        :param size      : size of the on-disk file in byte
+        :param checksum  : checksum of the file in hex, if any
+        :param algorithm : hash algorithm of the checksum
+        :return          : *none*
+        """
+        dir, name = os.path.split(path)
+        dirid = self._dirids.get(dir)
+        if dirid is None:
+            dirid = self._dirids[dir] = len(self._dirtable)
+            self._dirtable.append(dir)
+        digest = bytes.fromhex(checksum) if checksum else b''
+        if len(digest) > self._digestwidth:
+            self._widen(len(digest))
+        self._dir.append(dirid)
+        self._name.append(name)
+        self._size.append(size)
+        self._digest += digest.ljust(self._digestwidth, b'\0')
+        self._digestlen.append(len(digest))
+        if not digest:
+            algorithm = None
+        elif algorithm not in self._algotable:
+            self._algotable.append(algorithm)
+        self._algorithm.append(self._algotable.index(algorithm))
+
+    def _widen(self, width):
+        """ widen the digest column to fit a longer digest
+
+        :param width : new width of digest column in byte
+        :return      : *none*
+        """
+        old = self._digestwidth
+        digest = bytearray()
+        for idx in range(len(self._size)):
+            digest += self._digest[idx*old:(idx+1)*old].ljust(width, b'\0')
+        self._digest = digest
+        self._digestwidth = width
+
+    def view(self, index=0):
+        """ build a NfvFile view of given row
+
+        :param index : index of the row
+        :return      : NfvFile object
+        """
+        f = NfvFile.adopt(join(self._dirtable[self._dir[index]], self._name[index]), \
+                self._size[index], self._iotactic)
+        length = self._digestlen[index]
+        if length:
+            start = index * self._digestwidth
+            f._checksum = self._digest[start:start+length].hex()
+            f._algorithm = self._algotable[self._algorithm[index]]
+
+        return f
+
+    def _delete(self, index):
+        """ delete a row by moving the last row into its place
+
+        :param index : index of the row to be deleted
+        :return      : *none*
+        """
+        last = len(self._size) - 1
+        width = self._digestwidth
+        if index != last:
+            self._dir[index] = self._dir[last]
+            self._name[index] = self._name[last]
+            self._size[index] = self._size[last]
+            self._digest[index*width:(index+1)*width] = self._digest[last*width:]
+            self._digestlen[index] = self._digestlen[last]
+            self._algorithm[index] = self._algorithm[last]
+        self._dir.pop()
+        self._name.pop()
+        self._size.pop()
+        del self._digest[last*width:]
+        self._digestlen.pop()
+        self._algorithm.pop()
+
+    def add(self, file):
+        self.defer(file._path, file._size, file._checksum, file._algorithm)
+
+    def update(self, files):
+        for f in files:
+            self.add(f)
+
+    def pop(self):
+        """ pop the last row as a NfvFile view
+        """
+        if not self._size:
+            raise KeyError('pop from an empty set')
+        f = self.view(len(self._size) - 1)
+        self._delete(len(self._size) - 1)
+
+        return f
+
+    def clear(self):
+        self._dir = array('L')
+        self._name = []
+        self._size = array('q')
+        self._digest = bytearray()
+        self._digestlen = array('B')
+        self._algorithm = array('B')
+
+    def sample(self, number=1):
+        """ pick files randomly without replacement
+
+        :param number : number of files to be picked
+        :return       : list of NfvFile views
+        """
+        return [self.view(idx) for idx in Random().sample(range(len(self._size)), number)]
+
+    def total_size(self):
+        """ total size of files in catalog, computed on the size column
+
+        :return : size in byte
+        """
+        return sum(self._size)
+
+    def get_dir_stats(self):
+        """ aggregates of files per directory, computed on the columns
+
+        :return : dict maps directory to tuple of (file number, size in byte)
+        """
+        stats = defaultdict(lambda : [0, 0])
+        for dirid, size in zip(self._dir, self._size):
+            stat = stats[dirid]
+            stat[0] += 1
+            stat[1] += size
+
+        return {self._dirtable[d]: tuple(s) for d, s in stats.items()}
+
+    def __len__(self):
+        return len(self._size)
+
+    def __iter__(self):
+        """ yield a NfvFile view of each row
+        """
+        for idx in range(len(self._size)):
+            yield self.view(idx)
+
+
+class NfvDataGranary:
+    """ a granary of random bytes which hands out data without copying
+
+    the random bytes are stored twice back to back, so that any window 
+    up to the granary size starting at any offset is contiguous, 
+    handing out a random data pattern is then merely slicing a 
+    memoryview at a random offset, no matter how large the I/O is
+    """
+    __slots__ = (
+            '_size',
+            '_pool',
+            '_view',
+            '_rand',
+    )
+
+    def __init__(self, data=None, size=1048576, seed=None):
+        """ NfvDataGranary constructor
+
+        :param data : random bytes to be stored, generated if it's None
+        :param size : size of random bytes to be generated
+        :param seed : seed of the random offsets (and the generated bytes)
+        :return     : NfvDataGranary object
+        """
+        self._rand = Random(seed)
+        if data is None:
+            size = convert_size(size)
+            if seed is None:
+                data = os.urandom(size)
+            elif size:
+                # what Random.randbytes does, which is not there before Python 3.9
+                data = self._rand.getrandbits(size * 8).to_bytes(size, 'little')
+            else:
+                data = b''
+        if len(data) == 0:
+            raise ValueError("ERROR: granary can not be empty!")
+        self._size = len(data)
+        self._pool = bytes(data) * 2
+        self._view = memoryview(self._pool)
+
+    def view(self, size=0):
+        """ hand out a read-only window of random data at a random offset
+
+        :param size : size of data to be handed out
+        :return     : memoryview object, or bytes if size exceeds the granary
+        """
+        if size > self._size:
+            return bytes(self.fill(bytearray(size)))
+        offset = self._rand.randrange(self._size)
+        return self._view[offset:offset+size]
+
+    def fill(self, buffer=None):
+        """ fill a writable buffer with random data
+
+        :param buffer : preallocated bytearray, mmap or writable memoryview
+        :return       : the buffer just filled
+        """
+        dst = memoryview(buffer).cast('B')
+        total = len(dst)
+        pos = 0
+        while pos < total:
+            chunk = min(total - pos, self._size)
+            offset = self._rand.randrange(self._size)
+            dst[pos:pos+chunk] = self._view[offset:offset+chunk]
+            pos += chunk
+
+        return buffer
+
+    def __len__(self):
+        return self._size
+
+
+class NfvPermutation:
+    """ a keyed bijective permutation over [0, size)
+
+    the permutation is a composition of bijections on the smallest
+    power-of-2 domain covering size (multiply by odd number, add, 
+    xorshift), values beyond size are skipped (cycle walking), so
+    every index is visited exactly once with O(1) memory, and the
+    same seed always reproduces the same order
+    """
+    __slots__ = (
+            '_size',
+            '_bits',
+            '_mask',
+            '_keys',
+    )
+
+    def __init__(self, size=0, seed=None):
+        """ NfvPermutation constructor
+
+        :param size : number of indexes to be permuted
+        :param seed : seed of the permutation keys, random if it's None
+        :return     : NfvPermutation object
+        """
+        if size < 0:
+            raise ValueError("ERROR: parameter size should not be negative!")
+        self._size = size
+        self._bits = max(1, (size - 1).bit_length())
+        self._mask = (1 << self._bits) - 1
+        rand = Random(seed)
+        # two odd multipliers, an increment and a xor key
+        self._keys = (
+            rand.getrandbits(self._bits) | 1,
+            rand.getrandbits(self._bits),
+            rand.getrandbits(self._bits) | 1,
+            rand.getrandbits(self._bits),
+        )
+
+    def _mix(self, index):
+        """ bijection on the power-of-2 domain
+
+        :param index : value to be mixed
+        :return      : mixed value
+        """
+        mask = self._mask
+        shift = (self._bits + 1) // 2
+        mul1, add, mul2, xor = self._keys
+        x = (index * mul1 + add) & mask
+        x ^= x >> shift
+        x = (x * mul2) & mask
+        x ^= (x >> shift) ^ xor
+
+        return x
+
+    def __getitem__(self, index):
+        """ map an index to its permuted position (cycle walking)
+        """
+        if index < 0 or index >= self._size:
+            raise IndexError("permutation index out of range")
+        x = self._mix(index)
+        while x >= self._size:
+            x = self._mix(x)
+
+        return x
+
+    def __iter__(self):
+        """ yield every index of [0, size) exactly once in permuted order
+        """
+        size = self._size
+        mask = self._mask
+        shift = (self._bits + 1) // 2
+        mul1, add, mul2, xor = self._keys
+        for idx in range(mask + 1):
+            x = (idx * mul1 + add) & mask
+            x ^= x >> shift
+            x = (x * mul2) & mask
+            x ^= (x >> shift) ^ xor
+            if x < size:
+                yield x
+
+    def __len__(self):
+        return self._size
+
+
+class NfvSkew:
+    """ a skewed distribution of block indexes over [0, size)
+
+    every sample costs O(1) time and memory however large the range is,
+    'zipfian' is the closed form generator of Gray et al. (as YCSB does),
+    the normalization constant is summed exactly for the head and
+    integrated for the tail, ranks are scattered over the range by a
+    NfvPermutation so hot blocks are not all at the beginning, 'hotspot'
+    sends a percentage of I/Os to a percentage of blocks at the beginning
+    of the range, 'normal' centers I/Os around a point of the range, samples
+    falling out of the range are redrawn a few times and clamped then
+    """
+    __slots__ = (
+            '_kind',
+            '_size',
+            '_rand',
+            '_params',
+            '_perm',
+    )
+
+    _kinds = ('zipfian', 'hotspot', 'normal')
+    _defaults = {
+        'zipfian' : 0.99,        # theta, in (0, 1)
+        'hotspot' : (20, 80),    # (percent of blocks, percent of I/Os)
+        'normal'  : (0.5, 0.1),  # (center, standard deviation), fractions of the range
+    }
+    _EXACT_TERMS = 1024  # terms of zeta summed exactly
+    _REDRAWS = 16        # draws of 'normal' before a sample is clamped into range
+
+    def __init__(self, kind='zipfian', size=0, skew=None, seed=None):
+        """ NfvSkew constructor
+
+        :param kind : 'zipfian', 'hotspot' or 'normal'
+        :param size : number of blocks
+        :param skew : theta of 'zipfian', (hot blocks %, hot I/Os %) of 'hotspot',
+                      (center, sigma) of 'normal', default values if it's None
+        :param seed : seed of samples, the same seed reproduces the same samples
+        :return     : NfvSkew object
+        """
+        if kind not in self._kinds:
+            raise ValueError("ERROR: Given kind %s is invalid!" % kind)
+        if skew is None:
+            skew = self._defaults[kind]
+        self._kind = kind
+        self._size = size
+        self._rand = Random(seed)
+        self._perm = None
+        if kind == 'zipfian':
+            theta = float(skew)
+            if not 0 < theta < 1:
+                raise ValueError("ERROR: theta of zipfian should be in (0, 1)!")
+            zetan = self._zeta(size, theta)
+            zeta2 = self._zeta(2, theta)
+            alpha = 1.0 / (1.0 - theta)
+            eta = (1 - (2.0 / max(size, 2)) ** (1 - theta)) / (1 - zeta2 / zetan) if size > 2 else 0.0
+            self._params = (zetan, 1 + 0.5 ** theta, alpha, eta)
+            self._perm = NfvPermutation(size, self._rand.getrandbits(64))
+        elif kind == 'hotspot':
+            blocks, ios = skew
+            if not (0 < blocks <= 100 and 0 <= ios <= 100):
+                raise ValueError("ERROR: Given hotspot %s is invalid!" % (skew,))
+            self._params = (max(1, int(size * blocks / 100)), ios / 100.0)
+        else:
+            center, sigma = skew
+            if not 0 <= center <= 1:
+                raise ValueError("ERROR: center of normal should be in [0, 1]!")
+            if sigma <= 0:
+                raise ValueError("ERROR: sigma of normal should be larger than 0!")
+            self._params = (center * size, sigma * size)
+
+    @classmethod
+    def _zeta(cls, n=0, theta=0.99):
+        """ sum of i ** -theta for i in [1, n], the tail is integrated
+
+        :return : float value
+        """
+        head = min(n, cls._EXACT_TERMS)
+        zeta = sum(i ** -theta for i in range(1, head + 1))
+        if n > head:
+            zeta += ((n + 0.5) ** (1 - theta) - (head + 0.5) ** (1 - theta)) / (1 - theta)
+        return zeta
+
+    def __call__(self):
+        """ draw a block index
+
+        :return : index in [0, size)
+        """
+        size = self._size
+        rand = self._rand.random()
+        if self._kind == 'zipfian':
+            zetan, bound, alpha, eta = self._params
+            uz = rand * zetan
+            if uz < 1.0 or size == 1:
+                rank = 0
+            elif uz < bound:
+                rank = 1
+            else:
+                rank = min(size - 1, int(size * (eta * rand - eta + 1) ** alpha))
+            return self._perm[rank]
+        if self._kind == 'hotspot':
+            hot, ratio = self._params
+            if rand < ratio or hot >= size:
+                return self._rand.randrange(hot)
+            return self._rand.randrange(hot, size)
+        center, sigma = self._params
+        for _ in range(self._REDRAWS):
+            idx = int(self._rand.gauss(center, sigma))
+            if 0 <= idx < size:
+                return idx
+        return min(max(idx, 0), size - 1)
+
+    def __iter__(self):
+        """ draw size samples
+        """
+        for _ in range(self._size):
+            yield self()
+
+    def __len__(self):
+        return self._size
+
+
+class NfvRegions:
+    """ an interval index of io regions over a range
+
+    regions are widened to io size boundaries, merged when they overlap
+    or adjoin and clipped to the range, blocks of all regions are numbered
+    back to back, so any seek type could walk them as a single range, a
+    block is located by a binary search over regions
+    """
+    __slots__ = (
+            '_starts',
+            '_stops',
+            '_firsts',
+            '_numblock',
+            '_iosize',
+    )
+
+    def __init__(self, regions=(), size=0, io_size=8192):
+        """ NfvRegions constructor
+
+        :param regions : list of [start, stop] pairs relative to the range, sizes
+                         with units are accepted, a stop of 0 means the range end
+        :param size    : size of the range
+        :param io_size : size of each block
+        :return        : NfvRegions object
+        """
+        intervals = []
+        for start, stop in regions:
+            start, stop = convert_size(start), convert_size(stop)
+            if stop == 0:
+                stop = size
+            if stop < start:
+                raise ValueError("ERROR: Given io region [%s, %s] is invalid!" % (start, stop))
+            start = start // io_size * io_size
+            stop = min(size, -(-stop // io_size) * io_size)
+            if start < stop:
+                intervals.append([start, stop])
+        intervals.sort()
+        merged = []
+        for interval in intervals:
+            if merged and interval[0] <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], interval[1])
+            else:
+                merged.append(interval)
+        self._iosize = io_size
+        self._starts = array('q', (start for start, _ in merged))
+        self._stops = array('q', (stop for _, stop in merged))
+        self._firsts = array('q')
+        numblock = 0
+        for start, stop in merged:
+            self._firsts.append(numblock)
+            numblock += -(-(stop - start) // io_size)
+        self._numblock = numblock
+
+    def __getitem__(self, index):
+        """ locate a block
+
+        :param index : index of the block among blocks of all regions
+        :return      : tuple of (offset, length)
+        """
+        if index < 0 or index >= self._numblock:
+            raise IndexError("region block index out of range")
+        i = bisect_right(self._firsts, index) - 1
+        offset = self._starts[i] + (index - self._firsts[i]) * self._iosize
+        return (offset, min(self._iosize, self._stops[i] - offset))
+
+    def __iter__(self):
+        """ yield (offset, length) of every block in ascending order
+        """
+        iosize = self._iosize
+        for start, stop in zip(self._starts, self._stops):
+            for offset in range(start, stop, iosize):
+                yield (offset, min(iosize, stop - offset))
+
+    def __len__(self):
+        return self._numblock
+
+    def total_size(self):
+        """ total size of all regions
+
+        :return : size in byte
+        """
+        return sum(stop - start for start, stop in zip(self._starts, self._stops))
+
+
+class NfvThrottle:
+    """ token buckets pacing I/Os to target IOPS and bandwidth
+
+    a caller takes tokens for every I/O before issuing it, and sleeps
+    (out of the lock) for as long as the buckets are in debt, so the
+    cost is a lock and a few float operations per I/O, buckets hold a
+    hundredth second worth of tokens at most to keep the pace smooth,
+    a single object is shared by all files and threads of an io tactic,
+    with 'process' executor each process paces on its own
+    """
+    __slots__ = (
+            '_iops',
+            '_bps',
+            '_lock',
+            '_optokens',
+            '_bytetokens',
+            '_last',
+            '_first',
+            '_ops',
+            '_bytes',
+    )
+
+    _BURST = 0.01  # seconds worth of tokens a bucket holds at most
+
+    def __init__(self, iops=None, mbps=None):
+        """ NfvThrottle constructor
+
+        :param iops : target I/Os per second, unlimited if it's None
+        :param mbps : target MB per second, unlimited if it's None
+        :return     : NfvThrottle object
+        """
+        if iops is not None and iops <= 0 or mbps is not None and mbps <= 0:
+            raise ValueError("ERROR: target rates should be larger than 0!")
+        self._iops = iops
+        self._bps = None if mbps is None else mbps * 1048576
+        self._lock = threading.Lock()
+        self._optokens = 0.0
+        self._bytetokens = 0.0
+        self._last = None
+        self._first = None
+        self._ops = 0
+        self._bytes = 0
+
+    def acquire(self, nbytes=0):
+        """ take tokens of an I/O, block until the I/O could be issued
+
+        :param nbytes : size of the I/O
+        :return       : *none*
+        """
+        with self._lock:
+            now = time.perf_counter()
+            if self._last is None:
+                self._first = self._last = now
+            elapsed = now - self._last
+            self._last = now
+            wait = 0.0
+            if self._iops is not None:
+                self._optokens = min(self._optokens + elapsed * self._iops, max(1.0, self._iops * self._BURST)) - 1
+                if self._optokens < 0:
+                    wait = -self._optokens / self._iops
+            if self._bps is not None:
+                self._bytetokens = min(self._bytetokens + elapsed * self._bps, \
+                        max(float(nbytes), self._bps * self._BURST)) - nbytes
+                if self._bytetokens < 0:
+                    wait = max(wait, -self._bytetokens / self._bps)
+            self._ops += 1
+            self._bytes += nbytes
+        if wait > 0:
+            time.sleep(wait)
+
+    def reset(self):
+        """ forget the I/Os paced so far
+
+        :return : *none*
+        """
+        with self._lock:
+            self._optokens = self._bytetokens = 0.0
+            self._last = self._first = None
+            self._ops = self._bytes = 0
+
+    def get_property(self, name=None):
+        """ get the value of given property
+
+        achieved rates are measured from the first I/O paced to now
+
+        :param name : name of property to be retrieved
+        :return     : value of given parameter name, if param name was not given, return all properies
+        """
+        elapsed = 0.0 if self._first is None else time.perf_counter() - self._first
+        properties = {
+            'target_iops'   : self._iops,
+            'target_mbps'   : None if self._bps is None else self._bps / 1048576,
+            'ops'           : self._ops,
+            'bytes'         : self._bytes,
+            'elapsed'       : elapsed,
+            'achieved_iops' : self._ops / elapsed if elapsed > 0 else 0.0,
+            'achieved_mbps' : self._bytes / elapsed / 1048576 if elapsed > 0 else 0.0,
+        }
+
+        if name is None:
+            return properties
+        if name in properties.keys():
+            return properties[name]
+        else:
+            raise Exception("Given property name not found")
+
+    def __getstate__(self):
+        """ locks can not be pickled, pickle the configuration only
+        """
+        return (self._iops, None if self._bps is None else self._bps / 1048576)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+class NfvBufferPool:
+    """ a pool of page aligned buffers for direct I/O
+
+    data buffers are filled with data pattern once when the pool
+    is built, then handed out round-robin together with the digest
+    of their content, they are never modified afterwards, so that 
+    concurrent writers can share them, scratch buffers for reading 
+    are borrowed and returned by each reader
+    """
+    __slots__ = (
+            '_size',
+            '_count',
+            '_source',
+            '_buffers',
+            '_next',
+            '_scratch',
+            '_lock',
+    )
+
+    def __init__(self, size=4096, count=8, source=None):
+        """ NfvBufferPool constructor
+
+        :param size   : size of each buffer
+        :param count  : number of data buffers
+        :param source : callable object supplies data pattern of given size,
+                        buffers are zero filled if it's None
+        :return       : NfvBufferPool object
+        """
+        self._size = convert_size(size)
+        self._count = count
+        self._source = source
+        self._buffers = None
+        self._next = None
+        self._scratch = []
+        self._lock = threading.Lock()
+
+    def _fill(self):
+        """ allocate the data buffers and copy data pattern in
+
+        :return : *none*
+        """
+        buffers = []
+        for _ in range(self._count):
+            buf = mmap.mmap(-1, self._size)
+            if self._source is not None:
+                buf[:] = bytes(memoryview(self._source())[:self._size])
+            buffers.append((buf, digest_block(buf)))
+        self._buffers = buffers
+        self._next = cycle(buffers)
+
+    def get_data(self):
+        """ hand out the next data buffer, read-only by convention
+
+        :return : tuple of (aligned buffer, digest of its content as NfvVerifyIndex keeps)
+        """
+        if self._buffers is None:
+            with self._lock:
+                if self._buffers is None:
+                    self._fill()
+        return next(self._next)
+
+    def acquire(self):
+        """ borrow a scratch buffer for reading
+
+        :return : aligned buffer
+        """
+        with self._lock:
+            if self._scratch:
+                return self._scratch.pop()
+        return mmap.mmap(-1, self._size)
+
+    def release(self, buffer=None):
+        """ return a scratch buffer to the pool
+
+        :param buffer : buffer borrowed by acquire
+        :return       : *none*
+        """
+        with self._lock:
+            self._scratch.append(buffer)
+
+    def __getstate__(self):
+        """ buffers can not be pickled, pickle the configuration only
+        """
+        return (self._size, self._count, self._source)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
 class NfvIoTactic:
     """ Nfv I/O Tactic 
     the class defines the tactic of I/O
@@ -737,14 +2328,29 @@ class NfvIoTactic:
             '_data', 
             '_datacheck',
             '_ioregions',
+            '_seekseed',
+            '_seekskew',
+            '_batchdepth',
+            '_directio',
+            '_bufpool',
+            '_dataseed',
+            '_generation',
+            '_stamp',
+            '_writehash',
+            '_throttle',
+            '_fsync',
     )
 
-    _seeks = ('sequencial', 'random', 'reverse')
-    _patterns = ('fixed', 'random', 'bit', 'hex')
+    _seeks = ('sequencial', 'random', 'reverse') + NfvSkew._kinds
+    _patterns = ('fixed', 'random', 'bit', 'hex', 'stamp')
+    _alignment = 4096  # offsets and sizes of direct I/O should be multiple of it
     _datagranary = os.urandom(1048576)  # 1MB size data granary for random data pattern
+    _granary = NfvDataGranary(data=_datagranary)
 
     def __init__(self, io_size='8k', data_pattern='fixed', seek_type='sequencial', \
-                 data_check=True, io_regions=[[0,0]]):
+                 data_check=True, io_regions=[[0,0]], seek_seed=None, batch_depth=16, direct_io=False, \
+                 data_seed=None, generation=0, write_hash=None, seek_skew=None, iops=None, mbps=None, \
+                 fsync=False):
         """ NfvIoTactic constructor
 
         :param io_size      : io size of tactic to be adopted
@@ -752,12 +2358,37 @@ class NfvIoTactic:
         :param seek_type    : seek type of tactic to be adopted
         :param data_check   : a bool flag indicates if perform 
                               immediate data check on each file
+        :param io_regions   : list of [start, stop] pairs, I/Os are limited
+                              to these regions of each file or range, a stop
+                              of 0 means the end, [[0,0]] is the whole range
+        :param seek_seed    : seed of 'random' (and skewed) seek types, the same
+                              seed reproduces the same order of offsets
+        :param seek_skew    : shape of skewed seek types, theta of 'zipfian',
+                              (hot blocks %, hot I/Os %) of 'hotspot' and 
+                              (center, sigma) as fractions of range of 'normal'
+        :param batch_depth  : maximum number of adjacent I/Os submitted
+                              by a single vectored write
+        :param direct_io    : bypass the client cache with O_DIRECT, io_size
+                              and file sizes should be multiple of alignment
+        :param data_seed    : seed of 'stamp' data pattern, blocks written with
+                              it are verifiable later by anyone knows it
+        :param generation   : generation stamped into blocks of 'stamp' data
+                              pattern, bump it on each overwrite pass
+        :param write_hash   : hash algorithm of the checksum computed from the
+                              data being written, so files need not be read back
+        :param iops         : target I/Os per second of all files and threads
+                              sharing the tactic, unlimited if it's None
+        :param mbps         : target MB per second, unlimited if it's None
+        :param fsync        : flush data of each file (or block run) to stable
+                              storage before it's closed
         :return             : NfvIoTactic object
         """
         if seek_type not in self._seeks:
             raise ValueError("ERROR: Given seek_type %s is invalid!" % seek_type)
         if data_pattern not in self._patterns:
             raise ValueError("ERROR: Given data_pattern %s is invalid!" % data_pattern)
+        if batch_depth < 1:
+            raise ValueError("ERROR: Given batch_depth %s is invalid!" % batch_depth)
 
         self._iosize = convert_size(io_size)
         self._datapattern = data_pattern
@@ -765,7 +2396,24 @@ class NfvIoTactic:
         self._data = bytes()
         self._ioregions = io_regions[:]
         self._datacheck = data_check
-        if self._datapattern == 'random':
+        self._seekseed = seek_seed
+        self._seekskew = seek_skew
+        if seek_type in NfvSkew._kinds:
+            NfvSkew(seek_type, 1, seek_skew)
+        self._batchdepth = min(batch_depth, _IOV_MAX)
+        self._directio = direct_io
+        self._bufpool = None
+        self._dataseed = Random().getrandbits(63) if data_seed is None else data_seed
+        self._generation = generation
+        self._stamp = None
+        if write_hash is not None:
+            new_hash(write_hash)
+        self._writehash = write_hash
+        self._throttle = None
+        if iops is not None or mbps is not None:
+            self._throttle = NfvThrottle(iops, mbps)
+        self._fsync = fsync
+        if self._datapattern in ('random', 'stamp'):
             self.set_data_pattern(self.random_pattern(io_size=self._iosize))
         elif self._datapattern == 'fixed':
             self.set_data_pattern(self.fixed_pattern(io_size=self._iosize))
@@ -773,6 +2421,10 @@ class NfvIoTactic:
             self.set_data_pattern(self.bit_pattern(io_size=self._iosize))
         elif self._datapattern == 'hex':
             self.set_data_pattern(self.hex_pattern(io_size=self._iosize))
+        if self._directio:
+            if not hasattr(os, 'O_DIRECT'):
+                raise ValueError("ERROR: direct_io is not supported on this platform!")
+            self.check_alignment(self._iosize)
             
     def set_property(self, attrs={}):
         """ set given properties
@@ -785,11 +2437,27 @@ class NfvIoTactic:
             'data_pattern' : '_datapattern',
             'seek_type'    : '_seek',
             'data_check'   : '_datacheck',
+            'seek_seed'    : '_seekseed',
+            'seek_skew'    : '_seekskew',
+            'io_regions'   : '_ioregions',
+            'batch_depth'  : '_batchdepth',
+            'direct_io'    : '_directio',
+            'data_seed'    : '_dataseed',
+            'generation'   : '_generation',
+            'write_hash'   : '_writehash',
+            'fsync'        : '_fsync',
         }
 
         if type(attrs) is not dict:
             raise ValueError("ERROR: dictinonary param 'attrs' is required!")
 
+        # target rates replace the token buckets as a whole
+        if 'iops' in attrs or 'mbps' in attrs:
+            attrs = dict(attrs)
+            iops = attrs.pop('iops', self.get_property('iops'))
+            mbps = attrs.pop('mbps', self.get_property('mbps'))
+            self._throttle = None if iops is None and mbps is None else NfvThrottle(iops, mbps)
+
         for key, value in attrs.items():
             if key in properties.keys():
                 setattr(self, properties[key], value)
@@ -797,6 +2465,10 @@ class NfvIoTactic:
                 raise Exception("Given property name not found")
 
         self._iosize = convert_size(self._iosize)
+        self._bufpool = None
+        self._stamp = None
+        if self._directio:
+            self.check_alignment(self._iosize)
 
     def get_property(self, name=None):
         """ get the value of given property
@@ -809,6 +2481,17 @@ class NfvIoTactic:
             'data_pattern' : self._datapattern,
             'seek_type'    : self._seek,
             'data_check'   : self._datacheck,
+            'seek_seed'    : self._seekseed,
+            'seek_skew'    : self._seekskew,
+            'io_regions'   : self._ioregions,
+            'batch_depth'  : self._batchdepth,
+            'direct_io'    : self._directio,
+            'data_seed'    : self._dataseed,
+            'generation'   : self._generation,
+            'write_hash'   : self._writehash,
+            'iops'         : None if self._throttle is None else self._throttle.get_property('target_iops'),
+            'mbps'         : None if self._throttle is None else self._throttle.get_property('target_mbps'),
+            'fsync'        : self._fsync,
         }
 
         if name is None:
@@ -827,17 +2510,78 @@ class NfvIoTactic:
             raise ValueError("ERROR: parameter data is required!")
         self._data = data
         self._iosize = len(self._data)
+        self._bufpool = None
 
     def get_data_pattern(self):
         """ get data feed for each I/O 
 
-        :return : *none*
+        random data is a window of the shared granary rather than a copy,
+        it's valid until the next call and should not be kept around
+
+        :return : data pattern in bytes or memoryview
         """
         if self._datapattern == 'random':
-            self._data = NfvIoTactic.random_pattern(io_size=self._iosize)
+            return NfvIoTactic._granary.view(self._iosize)
 
         return self._data
 
+    def get_throttle(self):
+        """ get the token buckets pacing I/Os of the tactic, which also
+        report the achieved rates
+
+        :return : NfvThrottle object, None if the tactic is unlimited
+        """
+        return self._throttle
+
+    def pace(self, nbytes=0):
+        """ wait for the turn of an I/O when target rates are set
+
+        :param nbytes : size of the I/O
+        :return       : *none*
+        """
+        if self._throttle is not None:
+            self._throttle.acquire(nbytes)
+
+    def get_stamp(self):
+        """ get the generator of self-describing blocks, create it on first use
+
+        :return : NfvStamp object
+        """
+        if self._stamp is None:
+            self._stamp = NfvStamp(seed=self._dataseed)
+        return self._stamp
+
+    def stamp_data(self, file_id=0, offset=0, length=None):
+        """ generate the self-describing block of 'stamp' data pattern
+
+        :param file_id : id of the file the block belongs to
+        :param offset  : absolute offset of the block
+        :param length  : length of the block, default to io size
+        :return        : data in bytes
+        """
+        if length is None:
+            length = self._iosize
+        return self.get_stamp().make(file_id, offset, self._generation, length)
+
+    def get_buffer_pool(self):
+        """ get the pool of aligned buffers for direct I/O, create it on first use
+
+        :return : NfvBufferPool object
+        """
+        if self._bufpool is None:
+            self._bufpool = NfvBufferPool(size=self._iosize, count=max(self._batchdepth, 8), \
+                    source=self.get_data_pattern)
+        return self._bufpool
+
+    def check_alignment(self, size=0):
+        """ validate a size or offset against the alignment of direct I/O
+
+        :param size : size or offset to be validated
+        :return     : *none*
+        """
+        if size % self._alignment != 0:
+            raise ValueError("ERROR: %d is not aligned to %d bytes for direct I/O!" % (size, self._alignment))
+
     def clear_data_pattern(self):
         """ clear data
 
@@ -992,71 +2736,107 @@ class NfvIoTactic:
         :param buffer : buffer where data pool stores
         :return       : data grabbed 
         """
-        bufsize = len(buffer) - 33
-        offset = randint(0,bufsize)
-        bufend = bufsize - 1
-        ret = bytes()
-        while size>0:
-            if (size > bufsize):
-                buf = buffer[offset:bufend]
-                ret+= buf
-                size-= len(buf)
-                offset = 0
-            else:
-                start = randint(0,bufsize-size)
-                buf = buffer[start:start+size]
-                ret += buf
-                size-= len(buf)
+        src = memoryview(buffer)
+        bufsize = len(src)
+        ret = bytearray(size)
+        dst = memoryview(ret)
+        pos = 0
+        while pos < size:
+            chunk = min(size - pos, bufsize)
+            start = randint(0, bufsize - chunk)
+            dst[pos:pos+chunk] = src[start:start+chunk]
+            pos += chunk
 
-        return ret
+        return bytes(ret)
 
-    def seek_to(self, start_offset=0, stop_offset=None, file_size=None):
-        """ calculate the index of each write will locates on 
+    def get_regions(self, file_size=0):
+        """ get the interval index of io regions over a range
 
-        this is the fundamental algrithm for seek-type, which support three
-        types of seeking, 'sequencial', 'random' and 'reverse'. wherer 'random' 
-        is roughly 3x slower then the others
+        :param file_size : size of the range
+        :return          : NfvRegions object, None if regions cover the whole range
+        """
+        if not self._ioregions or all(convert_size(start) == 0 and convert_size(stop) == 0 \
+                for start, stop in self._ioregions):
+            return None
+        return NfvRegions(self._ioregions, file_size, self._iosize)
+
+    def covers_range(self, file_size=0):
+        """ check if I/Os of the tactic write every block of a range
 
-        :param file_size : file size of target file used to constituted the seek strategy
-        :return          : a generate object to supply the indexes
+        it's not the case for skewed seek types and io regions
+
+        :param file_size : size of the range
+        :return          : True or False
         """
-        if file_size is None:
-            file_size = stop_offset - start_offset
+        return self._seek not in NfvSkew._kinds and self.get_regions(file_size) is None
+
+    def _order(self, number=0):
+        """ supply indexes of [0, number) in the order of seek type
 
-        numwrite = file_size // self._iosize
-        remainder = file_size % self._iosize
-        if remainder > 0:
-            yield (file_size - remainder)
+        :param number : number of blocks
+        :return       : iterable object supplies the indexes
+        """
         if self._seek == 'sequencial':
-            for idx in range(start_offset, numwrite):
-                yield idx * self._iosize
+            return range(number)
         elif self._seek == 'reverse':
-            for idx in range(numwrite, start_offset, -1):
-                yield ((idx*self._iosize) - self._iosize)
+            return range(number - 1, -1, -1)
         elif self._seek == 'random':
-            # one million roughly use 20MB memory
-            # it's not the fully random algorithm
-            # while the number of I/O beyond a million
-            # according to trial, 'random' mode could be
-            # up to 3x slower than 'seq'
-            million = 1000 * 1000
-            numslice = numwrite // million 
-            remainder = numwrite % million
-            slicegroup = []
-            if numslice > 0:
-                for idx in range(start_offset, numwrite, million):
-                    slicegroup.append([idx, idx+million])
-                # remove last item is invalid which exceed 'numwrite'
-                slicegroup.pop()
-            if remainder > 0: 
-                slicegroup.append([(numwrite - remainder), numwrite])
-            shuffle(slicegroup)
-            for s in slicegroup:
-                slicelist = list(range(s[0], s[1]))
-                shuffle(slicelist)
-                for idx in slicelist:
-                    yield idx * self._iosize
-                slicelist = []
+            return NfvPermutation(number, self._seekseed)
+        elif number > 0:
+            return NfvSkew(self._seek, number, self._seekskew, self._seekseed)
+        return ()
+
+    def seek_requests(self, start_offset=0, stop_offset=None, file_size=None):
+        """ supply (offset, length) of each I/O in the order of seek type
+
+        the partial I/O of the tail goes first for 'reverse' seek type
+        and last for the others, with io regions only blocks within the
+        regions are supplied
+
+        :param start_offset : offset the range starts from
+        :param stop_offset  : offset the range stops at
+        :param file_size    : size of the range
+        :return             : a generate object to supply (offset, length) tuples
+        """
+        if file_size is None:
+            file_size = stop_offset - start_offset
+        regions = self.get_regions(file_size)
+        if regions is not None:
+            blocks = regions if self._seek == 'sequencial' else map(regions.__getitem__, self._order(len(regions)))
+            for offset, length in blocks:
+                yield (start_offset + offset, length)
+            return
+        iosize = self._iosize
+        remainder = file_size % iosize
+        rindex = start_offset + file_size - remainder
+        if remainder > 0 and self._seek == 'reverse':
+            yield (rindex, remainder)
+        for idx in self._order(file_size // iosize):
+            yield (start_offset + idx * iosize, iosize)
+        if remainder > 0 and self._seek != 'reverse':
+            yield (rindex, remainder)
+
+    def seek_to(self, start_offset=0, stop_offset=None, file_size=None):
+        """ calculate the index of each write will locates on 
+
+        this is the fundamental algrithm for seek-type, which support three
+        types of seeking, 'sequencial', 'random' and 'reverse'. all of them
+        yield absolute offsets within [start_offset, start_offset + file_size),
+        'random' walks a NfvPermutation so every block is visited exactly
+        once with constant memory, no matter how large the range is, the
+        skewed ones ('zipfian', 'hotspot' and 'normal') draw as many blocks
+        from a NfvSkew, hot blocks are visited many times and cold ones never,
+        with io regions the seek type applies to the blocks within regions
+        only, the cost is proportional to the size of regions, offsets are
+        in the very order of seek_requests
+
+        :param start_offset : offset the range starts from
+        :param stop_offset  : offset the range stops at
+        :param file_size    : file size of target file used to constituted the seek strategy
+        :return             : a generate object to supply the indexes
+        """
+        for offset, _ in self.seek_requests(start_offset, stop_offset, file_size):
+            yield offset
 
 
 class NfvAdsStream(NfvFile):
@@ -1440,7 +3220,7 @@ class NfvLock:
         if type(file) is not NfvFile:
             raise Exception("Passed file is not a NfvFile object")
 
-        self._filehandle = open(file.get_property('path'), 'r+b')
+        self._filehandle = traced('open', file.get_property('path'), 0, 0, open, file.get_property('path'), 'r+b')
         self._filepath = file.get_property('path')
         self._isattached = True
 
@@ -1498,10 +3278,10 @@ class NfvLock:
             raise Exception("Current lock has already switched on")
         
         if os.name == 'posix':
-            self._posix_lock(lock_mode=self._mode)
+            traced('lock', self._filepath, self._startoffset, self._length, self._posix_lock, self._mode)
             pass
         elif os.name == 'nt':
-            self._nt_lock(lock_mode=self._mode)
+            traced('lock', self._filepath, self._startoffset, self._length, self._nt_lock, self._mode)
             pass
 
         self._islocked = True
@@ -1515,10 +3295,10 @@ class NfvLock:
             raise Exception("lock hasn't attached to any file")
 
         if os.name == 'posix':
-            self._posix_lock(lock_mode='unlock')
+            traced('unlock', self._filepath, self._startoffset, self._length, self._posix_lock, 'unlock')
             pass
         elif os.name == 'nt':
-            self._nt_lock(lock_mode='unlock')
+            traced('unlock', self._filepath, self._startoffset, self._length, self._nt_lock, 'unlock')
 
         self._islocked = False 
 
@@ -1598,6 +3378,71 @@ class NfvLock:
             rv = fcntl.fcntl(fh, self._LOCK_MODES[mode][2], lockdata)
 
 
+def _file_task(method, args, kwargs, file):
+    """ invoke a method of NfvFile object, the task unit of NfvTree bulk manipulations
+
+    it's defined at module level so that it could be pickled for 'process' executor
+
+    :param method : name of NfvFile method to be invoked
+    :param args   : array arguments passed to the method
+    :param kwargs : keywords arguments passed to the method
+    :param file   : NfvFile object to be manipulated
+    :return       : tuple of (file, value returned by the method, size before)
+    """
+    size = file._size
+    return (file, getattr(file, method)(*args, **kwargs), size)
+
+
+def _create_task(size, io_tactic, path):
+    """ create a new NfvFile object, the task unit of NfvTree.create_file
+
+    :param size      : size of the file to be created
+    :param io_tactic : NfvIoTactic object to be used for I/O operation
+    :param path      : path of the file to be created
+    :return          : tuple of (file just created, none, 0)
+    """
+    return (NfvFile(path=path, size=size, io_tactic=io_tactic), None, 0)
+
+
+def _copy_task(src_root, dest_root, kwargs, file):
+    """ copy a NfvFile object to the mirrored path under another tree root
+
+    :param src_root  : root path of the source tree
+    :param dest_root : root path of the destination tree
+    :param kwargs    : keywords arguments passed to NfvFile.copy
+    :param file      : NfvFile object to be copied
+    :return          : tuple of (file, file just copied, size before)
+    """
+    return (file, file.copy(file._path.replace(src_root, dest_root, 1), **kwargs), file._size)
+
+
+def _scan_task(dir):
+    """ scan a directory once, the task unit of NfvTree.load_tree
+
+    :param dir : path of directory to be scanned
+    :return    : tuple of (dir, list of (file path, size), list of sub directories)
+    """
+    files = []
+    dirs = []
+    with os.scandir(dir) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry.path)
+            else:
+                files.append((entry.path, entry.stat(follow_symlinks=False).st_size))
+
+    return (dir, files, dirs)
+
+
+def _weigh_file(result):
+    """ bytes moved by a task, which is the size of the manipulated file
+
+    :param result : tuple returned by the task
+    :return       : size in byte
+    """
+    return result[0]._size
+
+
 def random_string(size=8, seed=None):
     """ generate a random string
     :param size : length of target string to be generated
@@ -1652,6 +3497,103 @@ def convert_size(raw_size):
         sys.exit("ERROR: Passed size is malformed!")
 
 
+def write_at(fd=None, buffers=None, offset=0):
+    """ write buffers back to back at given offset of a raw fd
+
+    a single pwritev call where it's available, short writes are
+    completed with pwrite, falls back to lseek + write elsewhere
+
+    :param fd      : raw file descriptor opened for writing
+    :param buffers : list of bytes-like objects to be written
+    :param offset  : offset the first buffer to be written at
+    :return        : number of bytes written
+    """
+    if _HAS_PWRITEV:
+        total = sum(len(b) for b in buffers)
+        written = os.pwritev(fd, buffers, offset)
+        if written < total:
+            rest = memoryview(b''.join(buffers))[written:]
+            while rest:
+                n = os.pwrite(fd, rest, offset + written)
+                written += n
+                rest = rest[n:]
+        return written
+    os.lseek(fd, offset, os.SEEK_SET)
+    data = buffers[0] if len(buffers) == 1 else b''.join(buffers)
+    written = 0
+    view = memoryview(data)
+    while written < len(view):
+        written += os.write(fd, view[written:])
+    return written
+
+
+def copy_data(src_fd=None, dst_fd=None, size=0, engine='auto', hasher=None):
+    """ copy size bytes from the start of one raw fd to another
+
+    with 'auto' the engines of _COPY_ENGINES are tried in order, an engine
+    which is not supported for the pair of files, or which copies nothing
+    before size is reached, hands over to the next one at the offset it
+    reached, the source ending before size is an error
+
+    :param src_fd : raw file descriptor opened for reading
+    :param dst_fd : raw file descriptor opened for writing
+    :param size   : number of bytes to be copied
+    :param engine : 'auto', 'copy_file_range', 'sendfile' or 'buffered'
+    :param hasher : hash object updated with the data copied, it's
+                    supported by the buffered engine only
+    :return       : tuple of (number of bytes copied, name of the engine finished the copy)
+    """
+    if hasher is not None and engine not in ('auto', 'buffered'):
+        raise ValueError("ERROR: hashing while copying requires the buffered engine!")
+    if hasher is not None:
+        engine = 'buffered'
+    if engine == 'auto':
+        engines = _COPY_ENGINES
+    elif engine in _COPY_ENGINES:
+        engines = (engine,)
+    else:
+        raise ValueError("ERROR: Given copy engine %s is invalid or unavailable!" % engine)
+    offset = 0
+    buffer = None
+    for name in engines:
+        try:
+            while offset < size:
+                count = size - offset
+                if name == 'copy_file_range':
+                    n = os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+                elif name == 'sendfile':
+                    os.lseek(dst_fd, offset, os.SEEK_SET)
+                    n = os.sendfile(dst_fd, src_fd, offset, count)
+                elif hasattr(os, 'preadv'):
+                    if buffer is None:
+                        buffer = memoryview(bytearray(min(size, _CHECKSUM_CHUNK)))
+                    n = os.preadv(src_fd, [buffer[:count]], offset)
+                    write_at(dst_fd, [buffer[:n]], offset)
+                    if hasher is not None:
+                        hasher.update(buffer[:n])
+                else:
+                    os.lseek(src_fd, offset, os.SEEK_SET)
+                    data = os.read(src_fd, min(count, _CHECKSUM_CHUNK))
+                    n = write_at(dst_fd, [data], offset) if data else 0
+                    if hasher is not None:
+                        hasher.update(data)
+                if n == 0:
+                    break
+                offset += n
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK or name == engines[-1]:
+                raise
+            continue
+        if offset < size:
+            # kernel engines may copy nothing, e.g. from pseudo files, the next engine carries on
+            if name != engines[-1]:
+                continue
+            raise Exception("ERROR: copy stopped at %d of %d bytes, the source ended early!" % (offset, size))
+        return (offset, name)
+
+    return (offset, engines[-1])
+
+
 def encipher_data(data=None, store=None):
     """ encode the given string to a checksum code, then put it in to store db
     :encipher : target string to be enciphered
@@ -0,0 +1,347 @@
+""" nfvverify.py implemented data verification of written I/Os
+
+:class NfvVerifyIndex : digests of written blocks keyed by offset, for verifying data read back
+:class NfvStamp       : self-describing blocks regenerable from (seed, file id, offset, generation)
+:class NfvCrcHash     : hashlib-like wrapper of the cheap zlib crc32/adler32 checksums
+:func  new_hash       : hash object of given algorithm, for checksumming whole files
+
+NOTEs:
+- each block of the range owns a fixed slot of digest_size bytes, so memory is
+  bounded by (range size / io size) * digest_size and never grows with rewrites
+- a block read back is compared with the digest of the very offset it was written,
+  which detects misplaced blocks as well as corrupted ones
+- writers of distinct blocks touch distinct slots, no lock is required
+- stamped blocks carry their own header, so they are verified by regenerating the
+  expected contents, without any state kept since they were written
+"""
+
+import struct
+import zlib
+import hashlib
+
+from hashlib import blake2b
+from random import Random
+
+
+class NfvVerifyIndex:
+    """ offset indexed digests of written blocks
+    """
+    __slots__ = (
+            '_start',
+            '_stop',
+            '_iosize',
+            '_numblock',
+            '_digestsize',
+            '_digests',
+            '_written',
+    )
+
+    def __init__(self, size=0, io_size=8192, start_offset=0, digest_size=8):
+        """ NfvVerifyIndex constructor
+
+        :param size         : size of the range to be indexed
+        :param io_size      : size of each block
+        :param start_offset : offset the range starts from
+        :param digest_size  : size in byte of the digest kept for each block
+        :return             : NfvVerifyIndex object
+        """
+        if io_size <= 0:
+            raise ValueError("ERROR: parameter io_size should be larger than 0!")
+        self._start = start_offset
+        self._stop = start_offset + size
+        self._iosize = io_size
+        self._numblock = -(-size // io_size)
+        self._digestsize = digest_size
+        self._digests = bytearray(self._numblock * digest_size)
+        self._written = bytearray(self._numblock)
+
+    def digest(self, data=None):
+        """ digest of a block in the size this index keeps
+
+        :param data : bytes-like object
+        :return     : digest in bytes
+        """
+        return digest_block(data, self._digestsize)
+
+    def _slot(self, offset):
+        """ index of the block which given offset locates
+
+        :param offset : absolute offset of the block
+        :return       : index of the block
+        """
+        slot, misalign = divmod(offset - self._start, self._iosize)
+        if misalign or slot < 0 or slot >= self._numblock:
+            raise ValueError("ERROR: offset %d is not a block of the indexed range!" % offset)
+        return slot
+
+    def record(self, offset=0, data=None, digest=None):
+        """ record the block written at given offset
+
+        :param offset : absolute offset the block was written at
+        :param data   : data written, exactly as long as the I/O
+        :param digest : digest of data computed beforehand, if any
+        :return       : *none*
+        """
+        slot = self._slot(offset)
+        if digest is None or len(digest) != self._digestsize:
+            digest = self.digest(data)
+        size = self._digestsize
+        self._digests[slot*size:(slot+1)*size] = digest
+        self._written[slot] = 1
+
+    def verify(self, offset=0, data=None):
+        """ check the block read back from given offset
+
+        blocks which were never recorded are considered as matched
+
+        :param offset : absolute offset the block was read from
+        :param data   : data read back
+        :return       : True or False
+        """
+        slot = self._slot(offset)
+        if not self._written[slot]:
+            return True
+        size = self._digestsize
+        return self._digests[slot*size:(slot+1)*size] == self.digest(data)
+
+    def verify_stream(self, chunks=()):
+        """ check blocks streamed back one by one
+
+        :param chunks : iterable object supplies (offset, data) tuples
+        :return       : list of offsets which failed the check
+        """
+        return [offset for offset, data in chunks if not self.verify(offset, data)]
+
+    def requests(self):
+        """ (offset, length) of every recorded block in ascending order
+
+        :param : *none*
+        :yield : tuple of (offset, length)
+        """
+        for slot in range(self._numblock):
+            if self._written[slot]:
+                offset = self._start + slot * self._iosize
+                yield (offset, min(self._iosize, self._stop - offset))
+
+    def clear(self):
+        """ forget all recorded blocks
+
+        :return : *none*
+        """
+        self._digests = bytearray(self._numblock * self._digestsize)
+        self._written = bytearray(self._numblock)
+
+    def __len__(self):
+        return self._numblock
+
+
+def digest_block(data=None, digest_size=8):
+    """ digest of a block as NfvVerifyIndex keeps it
+
+    :param data        : bytes-like object
+    :param digest_size : size of digest in byte
+    :return            : digest in bytes
+    """
+    return blake2b(data, digest_size=digest_size).digest()
+
+
+class NfvStamp:
+    """ generator and checker of self-describing blocks
+
+    each block starts with a header of magic, length, seed, file id,
+    offset and generation protected by a crc32, the rest of it is a
+    slice of a granary generated from the seed, the slice is picked
+    by the header, so that the whole block is determined by the header
+    and anyone knows the seed could regenerate it on any host
+    """
+    __slots__ = (
+            '_seed',
+            '_granary',
+    )
+
+    _MAGIC = b'NFVS'
+    _HEADER = struct.Struct('<4sIQQQQ')
+    _CRC = struct.Struct('<I')
+    HEADER_SIZE = _HEADER.size + _CRC.size
+
+    def __init__(self, seed=0, size=1048576):
+        """ NfvStamp constructor
+
+        :param seed : seed of the data, blocks are regenerable with it only
+        :param size : size of the granary, blocks are regenerable with the same size only
+        :return     : NfvStamp object
+        """
+        self._seed = seed & 0xffffffffffffffff
+        # what Random.randbytes does, which is not there before Python 3.9
+        self._granary = Random(self._seed).getrandbits(size * 8).to_bytes(size, 'little')
+
+    def _header(self, file_id=0, offset=0, generation=0, length=0):
+        """ header of a block
+
+        :return : header in bytes
+        """
+        header = self._HEADER.pack(self._MAGIC, length, self._seed, file_id & 0xffffffffffffffff, \
+                offset, generation)
+        return header + self._CRC.pack(zlib.crc32(header))
+
+    def make(self, file_id=0, offset=0, generation=0, length=0):
+        """ generate the block written at given offset
+
+        :param file_id    : id of the file (or LUN) the block belongs to
+        :param offset     : absolute offset of the block
+        :param generation : generation of the data, bumped on each overwrite pass
+        :param length     : length of the block
+        :return           : data in bytes
+        """
+        header = self._header(file_id, offset, generation, length)
+        if length <= self.HEADER_SIZE:
+            return header[:length]
+        # the body wraps around the granary, so blocks of any size are supported
+        granary = memoryview(self._granary)
+        pos = int.from_bytes(header[-self._CRC.size:], 'little') * 2654435761 % len(granary)
+        parts = [header]
+        remain = length - self.HEADER_SIZE
+        while remain:
+            parts.append(granary[pos:pos+remain])
+            remain -= len(parts[-1])
+            pos = 0
+        return b''.join(parts)
+
+    def parse(self, data=None):
+        """ parse the header of a block
+
+        :param data : data read back
+        :return     : tuple of (seed, file id, offset, generation, length),
+                      None if the block is too short or the header is corrupt
+        """
+        if len(data) < self.HEADER_SIZE:
+            return None
+        header = bytes(data[:self._HEADER.size])
+        crc, = self._CRC.unpack_from(data, self._HEADER.size)
+        if zlib.crc32(header) != crc:
+            return None
+        magic, length, seed, fileid, offset, generation = self._HEADER.unpack(header)
+        if magic != self._MAGIC:
+            return None
+        return (seed, fileid, offset, generation, length)
+
+    def check(self, data=None, offset=0, file_id=None, generation=None):
+        """ check the block read back from given offset
+
+        file id and generation are enforced only if they are given, blocks
+        shorter than a header are checked only if both are given
+
+        :param data       : data read back
+        :param offset     : absolute offset the block was read from
+        :param file_id    : expected file id
+        :param generation : expected generation
+        :return           : None if matched, otherwise the reason of mismatch
+        """
+        if len(data) < self.HEADER_SIZE:
+            if file_id is None or generation is None:
+                return None
+            if data != self.make(file_id, offset, generation, len(data)):
+                return 'corrupt data'
+            return None
+        header = self.parse(data)
+        if header is None:
+            return 'corrupt header'
+        seed, fileid, writeoffset, writegeneration, length = header
+        if seed != self._seed:
+            return 'foreign seed'
+        if writeoffset != offset:
+            return 'misdirected write from offset %d' % writeoffset
+        if file_id is not None and fileid != file_id & 0xffffffffffffffff:
+            return 'misdirected write from file %x' % fileid
+        if generation is not None and writegeneration < generation:
+            return 'stale generation %d' % writegeneration
+        if generation is not None and writegeneration != generation:
+            return 'unexpected generation %d' % writegeneration
+        if length != len(data):
+            return 'length mismatch'
+        if data != self.make(fileid, offset, writegeneration, length):
+            return 'corrupt data'
+        return None
+
+    def __getstate__(self):
+        """ the granary is regenerable, pickle the configuration only
+        """
+        return (self._seed, len(self._granary))
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+def stamp_id(name=''):
+    """ id of a file (or LUN) stamped into its blocks
+
+    :param name : name of the file
+    :return     : 64-bit integer
+    """
+    return int.from_bytes(blake2b(name.encode(), digest_size=8).digest(), 'little')
+
+
+class NfvCrcHash:
+    """ hashlib-like wrapper of zlib crc32 and adler32
+
+    they are not cryptographic, but several times cheaper than md5,
+    good enough to detect corruption when CPU is the bottleneck
+    """
+    __slots__ = (
+            'name',
+            '_func',
+            '_value',
+    )
+
+    _funcs = {
+        'crc32'   : (zlib.crc32, 0),
+        'adler32' : (zlib.adler32, 1),
+    }
+    digest_size = 4
+    block_size = 1
+
+    def __init__(self, name='crc32', data=None):
+        """ NfvCrcHash constructor
+
+        :param name : either 'crc32' or 'adler32'
+        :param data : initial data to be hashed
+        :return     : NfvCrcHash object
+        """
+        if name not in self._funcs:
+            raise ValueError("ERROR: Given hash algorithm %s is invalid!" % name)
+        self.name = name
+        self._func, self._value = self._funcs[name]
+        if data is not None:
+            self.update(data)
+
+    def update(self, data=None):
+        self._value = self._func(data, self._value)
+
+    def digest(self):
+        return self._value.to_bytes(4, 'big')
+
+    def hexdigest(self):
+        return '%08x' % self._value
+
+    def copy(self):
+        other = NfvCrcHash(self.name)
+        other._value = self._value
+        return other
+
+
+def new_hash(algorithm='md5'):
+    """ hash object of given algorithm
+
+    :param algorithm : 'crc32', 'adler32' or any fixed-length algorithm of
+                       hashlib, such as 'md5', 'sha1', 'sha256' and 'blake2b'
+    :return          : hash object
+    """
+    if algorithm in NfvCrcHash._funcs:
+        return NfvCrcHash(algorithm)
+    if algorithm not in hashlib.algorithms_available:
+        raise ValueError("ERROR: Given hash algorithm %s is invalid!" % algorithm)
+    hasher = hashlib.new(algorithm)
+    # variable-length ones (shake_128, shake_256) have no digest without a length
+    if not hasher.digest_size:
+        raise ValueError("ERROR: Given hash algorithm %s has no fixed digest length!" % algorithm)
+    return hasher
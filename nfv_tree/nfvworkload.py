@@ -0,0 +1,320 @@
+""" nfvworkload.py implemented the mixed workload runner of a file tree
+
+:class NfvWorkload : interleaves reads, writes, appends and metadata operations at a given mix
+
+NOTEs:
+- 'read' and 'write' move a single I/O of io size, offsets of each file follow the
+  seek type and io regions of io tactic, as a cursor resumed by the next operation
+- 'append' writes an I/O at the end of a file, 'create', 'remove', 'rename' and
+  'stat' are metadata operations, operations which need a file create one if the
+  worker has none left
+- files are dealt to workers up front and each worker only touches its own files,
+  so no operation ever races another one on the same file
+- the run is bounded by duration, number of operations, or both
+- the tree is reconciled once the run finished, its files, size accounting and
+  merkle reflect every file created, removed, renamed or written, only the
+  files changed by the run are accounted
+"""
+
+import os
+import time
+
+from bisect import bisect_right
+from itertools import accumulate
+from random import Random
+from os.path import join
+
+from nfv_tree.nfvtree import NfvFile, NfvCatalog, convert_size, random_string, write_at
+from nfv_tree.nfvexec import NfvExecutor, NfvExecReport
+from nfv_tree.nfvhook import traced
+
+
+class NfvWorkload:
+    """ a time or count bounded run of mixed operations against a NfvTree
+    """
+    __slots__ = (
+            '_tree',
+            '_mix',
+            '_duration',
+            '_ops',
+            '_workers',
+            '_seed',
+            '_createsize',
+            '_iotactic',
+            '_reports',
+            '_elapsed',
+    )
+
+    _operations = ('read', 'write', 'append', 'create', 'remove', 'rename', 'stat')
+
+    def __init__(self, tree=None, mix=None, duration=None, ops=None, workers=1, seed=None, \
+                 create_size='8k', io_tactic=None):
+        """ NfvWorkload constructor
+
+        :param tree        : NfvTree object the workload runs against
+        :param mix         : dict maps operations to their weights, e.g.
+                             {'read': 70, 'write': 30}
+        :param duration    : seconds the run lasts
+        :param ops         : number of operations of the run
+        :param workers     : number of threads issuing operations
+        :param seed        : seed of the operation sequence
+        :param create_size : size of files created by 'create'
+        :param io_tactic   : NfvIoTactic object, default to the one of tree
+        :return            : NfvWorkload object
+        """
+        if tree is None:
+            raise ValueError("ERROR: parameter tree is required!")
+        if mix is None:
+            mix = {'read': 70, 'write': 30}
+        for op, weight in mix.items():
+            if op not in self._operations:
+                raise ValueError("ERROR: Given operation %s is invalid!" % op)
+            if weight < 0:
+                raise ValueError("ERROR: weight of operation %s should not be negative!" % op)
+        if sum(mix.values()) <= 0:
+            raise ValueError("ERROR: parameter mix has no operation weighted!")
+        if duration is None and ops is None:
+            raise ValueError("ERROR: either duration or ops is required!")
+        if workers < 1:
+            raise ValueError("ERROR: parameter workers should be larger than 0!")
+        self._tree = tree
+        self._mix = {op: weight for op, weight in mix.items() if weight > 0}
+        self._duration = duration
+        self._ops = ops
+        self._workers = workers
+        self._seed = seed
+        self._createsize = convert_size(create_size)
+        self._iotactic = tree._iotactic if io_tactic is None else io_tactic
+        self._reports = {}
+        self._elapsed = 0.0
+
+    def run(self):
+        """ run the workload
+
+        :return : dict maps each operation to a NfvExecReport object, whose
+                  ops and throughput are rates over the whole run
+        """
+        tree = self._tree
+        files = list(tree._files)
+        shares = [files[i::self._workers] for i in range(self._workers)]
+        dirs = sorted(tree._dirs) or [tree._root]
+        if self._ops is None:
+            quotas = [None] * self._workers
+        else:
+            quotas = [self._ops // self._workers + (i < self._ops % self._workers) for i in range(self._workers)]
+        seeds = Random(self._seed)
+        jobs = [(shares[i], quotas[i], seeds.getrandbits(64)) for i in range(self._workers)]
+        if self._workers > 1:
+            executor = NfvExecutor(mode='thread', workers=self._workers, backlog=1)
+        else:
+            executor = NfvExecutor()
+        begin = time.perf_counter()
+        deadline = None if self._duration is None else begin + self._duration
+        with executor:
+            report = executor.run(lambda job: self._work(job, dirs, deadline), jobs).check()
+        self._elapsed = time.perf_counter() - begin
+
+        reports = {op: NfvExecReport() for op in self._mix}
+        changes = []
+        files = []
+        for share, worker, journal in report.get_property('results'):
+            files.extend(share)
+            changes.extend(journal)
+            for op, r in worker.items():
+                reports.setdefault(op, NfvExecReport()).merge(r)
+        for r in reports.values():
+            r.merge(elapsed=self._elapsed)
+        self._reconcile(files, changes)
+        self._reports = reports
+
+        return reports
+
+    def _work(self, job=None, dirs=(), deadline=None):
+        """ issue operations of a worker until its quota or the deadline
+
+        :param job      : tuple of (files owned by the worker, number of operations, seed)
+        :param dirs     : directories files are created in
+        :param deadline : perf_counter value the run stops at
+        :return         : tuple of (files owned at the end, {op: NfvExecReport object},
+                          list of changes made, see _reconcile)
+        """
+        files, quota, seed = job
+        rand = Random(seed)
+        ops = list(self._mix)
+        cumweights = list(accumulate(self._mix[op] for op in ops))
+        total = cumweights[-1]
+        stats = {op: NfvExecReport() for op in ops}
+        cursors = {}
+        changes = []
+        done = 0
+        while (quota is None or done < quota) and (deadline is None or time.perf_counter() < deadline):
+            done += 1
+            op = ops[bisect_right(cumweights, rand.random() * total)]
+            if not files and op != 'create':
+                op = 'create'
+                stats.setdefault(op, NfvExecReport())
+            index = rand.randrange(len(files)) if files else None
+            f = files[index] if files else None
+            try:
+                nbytes = self._operate(op, f, index, files, cursors, changes, dirs, rand)
+            except Exception as e:
+                stats[op].add_failure(f, e)
+            else:
+                stats[op].add_result(f, None, nbytes, keep=False)
+
+        return (files, stats, changes)
+
+    def _operate(self, op, f, index, files, cursors, changes, dirs, rand):
+        """ perform a single operation
+
+        :return : number of bytes moved
+        """
+        tactic = self._iotactic
+        if op == 'read' or op == 'write':
+            cursor = cursors.get(f)
+            request = next(cursor, None) if cursor is not None else None
+            if request is None:
+                cursor = cursors[f] = tactic.seek_requests(file_size=f._size)
+                request = next(cursor, None)
+                if request is None:
+                    return 0
+            offset, length = request
+            tactic.pace(length)
+            if op == 'read':
+                fd = traced('open', f._path, 0, 0, os.open, f._path, os.O_RDONLY)
+                try:
+                    return len(traced('read', f._path, offset, length, os.pread, fd, length, offset))
+                finally:
+                    os.close(fd)
+            fd = traced('open', f._path, 0, 0, os.open, f._path, os.O_WRONLY)
+            try:
+                written = traced('write', f._path, offset, length, write_at, fd, [self._data(f, offset, length)], offset)
+            finally:
+                os.close(fd)
+            f._checksum = None
+            changes.append(('write', f, 0))
+            return written
+        elif op == 'append':
+            length = tactic.get_property('io_size')
+            tactic.pace(length)
+            fd = traced('open', f._path, 0, 0, os.open, f._path, os.O_WRONLY)
+            try:
+                written = traced('write', f._path, f._size, length, write_at, fd, [self._data(f, f._size, length)], \
+                        f._size)
+            finally:
+                os.close(fd)
+            f._size += written
+            f._checksum = None
+            cursors.pop(f, None)
+            changes.append(('append', f, written))
+            return written
+        elif op == 'create':
+            path = join(dirs[rand.randrange(len(dirs))], random_string(8))
+            f = NfvFile(path=path, size=self._createsize, io_tactic=tactic)
+            files.append(f)
+            changes.append(('create', f, 0))
+            return f._size
+        elif op == 'remove':
+            f.remove()
+            files[index] = files[-1]
+            files.pop()
+            cursors.pop(f, None)
+            changes.append(('remove', f, 0))
+            return 0
+        elif op == 'rename':
+            name = f._name
+            f.rename()
+            changes.append(('rename', f, name))
+            return 0
+        os.stat(f._path)
+        return 0
+
+    def _data(self, f, offset, length):
+        """ data to be written at given offset of a file
+
+        :return : bytes-like object of length
+        """
+        tactic = self._iotactic
+        if tactic.get_property('data_pattern') == 'stamp':
+            return tactic.stamp_data(f.file_id, offset, length)
+        return memoryview(tactic.get_data_pattern())[:length]
+
+    def _reconcile(self, files=(), changes=()):
+        """ put the changes of the run into the tree
+
+        files of the tree are changed in place by workers, so only the files
+        created, removed or changed are accounted, except that a catalog is
+        rebuilt from the files at the end, since workers change views of
+        its rows rather than the rows
+
+        :param files   : NfvFile objects existing at the end of the run
+        :param changes : (operation, file, value) tuples in the order they were made,
+                         value is the bytes appended by 'append', the former name by 'rename'
+        :return        : *none*
+        """
+        tree = self._tree
+        catalog = type(tree._files) is NfvCatalog
+        if catalog:
+            container = tree._files.spawn()
+            container.update(files)
+            tree._files = container
+        created = set()
+        for op, f, value in changes:
+            if op == 'create':
+                if not catalog:
+                    tree._files.add(f)
+                # accounted with its size at the end of the run, appends to it included
+                tree._account(f)
+                created.add(f)
+            elif op == 'remove':
+                if not catalog:
+                    tree._files.discard(f)
+                tree._account(f, -1)
+            elif op == 'append':
+                if f not in created:
+                    tree._resize(f, value)
+            else:
+                if op == 'rename' and tree._dirindex is not None:
+                    named = tree._dirindex.setdefault(f._dir, {})
+                    named.pop(value, None)
+                    named[f._name] = f
+                tree._invalidate()
+                if tree._merkle is not None:
+                    tree._merkle.touch(f._dir)
+
+    def get_property(self, name=None):
+        """ get the value of given property
+
+        :param name : name of property to be retrieved
+        :return     : value of given parameter name, if param name was not given, return all properies
+        """
+        properties = {
+            'mix'      : self._mix,
+            'duration' : self._duration,
+            'ops'      : self._ops,
+            'workers'  : self._workers,
+            'seed'     : self._seed,
+            'reports'  : self._reports,
+            'elapsed'  : self._elapsed,
+        }
+
+        if name is None:
+            return properties
+        if name in properties.keys():
+            return properties[name]
+        else:
+            raise Exception("Given property name not found")
+
+    def summary(self):
+        """ rates of each operation of the last run
+
+        :return : dict maps each operation to a dict of ops, errors,
+                  bytes, ops_per_sec and mb_per_sec
+        """
+        return {op: {
+                    'ops'         : r.get_property('succeeded'),
+                    'errors'      : r.get_property('failed'),
+                    'bytes'       : r.get_property('bytes'),
+                    'ops_per_sec' : r.ops,
+                    'mb_per_sec'  : r.throughput / 1048576,
+                } for op, r in self._reports.items()}
@@ -12,9 +12,10 @@ setup(
     keywords = ['io_tool', 'test', 'block io', 'nas', 'nfs', 'cifs', 'lock', 'ads', 'io'],
     license = 'MIT',
     include_package_data=True,
+    python_requires = '>=3.7',
     classifiers = [
         'License :: OSI Approved :: MIT License',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
     ],
 )
 
@@ -0,0 +1,60 @@
+""" behaviour checks of nfvlatency
+"""
+
+import unittest
+
+from random import Random
+
+from nfv_tree.nfvlatency import NfvHistogram
+
+def exact_percentile(values, percent):
+    """ value of given percentile, of the same rank as NfvHistogram takes
+    """
+    ordered = sorted(values)
+    rank = max(1, -int(-percent * len(ordered) // 100))
+    return ordered[rank - 1]
+
+class NfvHistogramTest(unittest.TestCase):
+
+    def setUp(self):
+        # latency-like values in nanoseconds, from a few ns to seconds
+        rand = Random(1)
+        self.values = [int(rand.lognormvariate(12, 2.5)) for _ in range(20000)] + [0, 1, 127, 128, 10 ** 10]
+
+    def test_percentiles_within_bounds(self):
+        histogram = NfvHistogram()
+        for value in self.values:
+            histogram.record(value)
+        for percent in (0, 1, 25, 50, 90, 99, 99.9, 99.99, 100):
+            exact = exact_percentile(self.values, percent)
+            value = histogram.percentile(percent)
+            # buckets are 1/64 wide at most, relative to the values they hold
+            self.assertGreaterEqual(value, exact, percent)
+            self.assertLessEqual(value, exact + exact // 64, percent)
+        self.assertEqual(histogram.percentile(0), min(self.values))
+        self.assertEqual(histogram.percentile(100), max(self.values))
+
+    def test_small_values_exact(self):
+        histogram = NfvHistogram()
+        for value in range(128):
+            histogram.record(value)
+        for percent in range(1, 101):
+            self.assertEqual(histogram.percentile(percent), exact_percentile(range(128), percent))
+
+    def test_merge(self):
+        whole, half1, half2 = NfvHistogram(), NfvHistogram(), NfvHistogram()
+        for i, value in enumerate(self.values):
+            whole.record(value)
+            (half1 if i % 2 else half2).record(value)
+        half1.merge(half2).merge(NfvHistogram())
+        self.assertEqual(half1.get_property(), whole.get_property())
+
+    def test_empty_and_invalid(self):
+        histogram = NfvHistogram()
+        self.assertEqual(histogram.percentile(99), 0)
+        self.assertEqual(histogram.get_property('count'), 0)
+        self.assertRaises(ValueError, histogram.percentile, -1)
+        self.assertRaises(ValueError, histogram.percentile, 100.1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+""" behaviour checks of nfvtree
+"""
+
+import unittest
+
+from collections import Counter
+
+from nfv_tree.nfvtree import NfvPermutation, NfvSkew
+
+class NfvPermutationTest(unittest.TestCase):
+
+    def test_bijective(self):
+        # power-of-2 sizes and sizes cycle walking has to skip values for
+        for size in (1, 2, 3, 7, 64, 100, 1000, 4097):
+            perm = NfvPermutation(size, seed=size)
+            self.assertEqual(len(perm), size)
+            self.assertEqual(sorted(perm), list(range(size)))
+            self.assertEqual(sorted(perm[i] for i in range(size)), list(range(size)))
+
+    def test_reproducible_from_seed(self):
+        self.assertEqual(list(NfvPermutation(1000, seed=7)), list(NfvPermutation(1000, seed=7)))
+        self.assertNotEqual(list(NfvPermutation(1000, seed=7)), list(NfvPermutation(1000, seed=8)))
+
+    def test_out_of_range(self):
+        perm = NfvPermutation(10, seed=1)
+        self.assertRaises(IndexError, perm.__getitem__, 10)
+        self.assertRaises(IndexError, perm.__getitem__, -1)
+        self.assertRaises(ValueError, NfvPermutation, -1)
+
+class NfvSkewTest(unittest.TestCase):
+
+    def test_within_bounds(self):
+        cases = (('zipfian', None), ('zipfian', 0.5), ('hotspot', None), ('hotspot', (100, 100)), \
+                 ('normal', None), ('normal', (0, 0.1)), ('normal', (1, 0.5)))
+        for kind, skew in cases:
+            for size in (1, 2, 1000):
+                skewed = NfvSkew(kind, size, skew, seed=size)
+                samples = [skewed() for _ in range(2000)]
+                self.assertTrue(all(0 <= s < size for s in samples), (kind, skew, size))
+
+    def test_reproducible_from_seed(self):
+        for kind in NfvSkew._kinds:
+            skew1, skew2 = NfvSkew(kind, 1000, seed=3), NfvSkew(kind, 1000, seed=3)
+            self.assertEqual([skew1() for _ in range(100)], [skew2() for _ in range(100)])
+
+    def test_skewed(self):
+        # a tenth of blocks take most of zipfian I/Os, the hot fifth takes 80% of hotspot ones
+        skewed = NfvSkew('zipfian', 1000, seed=1)
+        counts = Counter(skewed() for _ in range(20000))
+        self.assertGreater(sum(c for _, c in counts.most_common(100)), 20000 * 0.5)
+        skewed = NfvSkew('hotspot', 1000, (20, 80), seed=1)
+        hits = sum(skewed() < 200 for _ in range(20000))
+        self.assertAlmostEqual(hits / 20000, 0.8, delta=0.03)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, NfvSkew, 'uniform', 10)
+        self.assertRaises(ValueError, NfvSkew, 'zipfian', 10, 1)
+        self.assertRaises(ValueError, NfvSkew, 'hotspot', 10, (0, 50))
+        self.assertRaises(ValueError, NfvSkew, 'normal', 10, (1.5, 0.1))
+        self.assertRaises(ValueError, NfvSkew, 'normal', 10, (0.5, 0))
+
+if __name__ == '__main__':
+    unittest.main()